@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+from hutchinson import render_hutchinson
+from main import draw_fern, draw_fern_vectorized, iter_fern
+from parallel import render_fern_parallel
+from render import DensityHistogram, ifs_bounds, render_fern, render_fern_adaptive
+from store import write_fern
+from viewport import TileRenderer
+
+SIZES = [10 ** k for k in range(4, 9)]
+CHECK_POINTS = 10 ** 6
+CHECK_RESOLUTION = 64
+STAT_TOLERANCE = 0.08
+REGRESSION = 0.2
+HUTCHINSON_OVERSAMPLE = 8
+
+
+# Each engine is a generator: whatever it yields first counts as the first
+# point, and it is exhausted to measure the full run. Points engines yield
+# (x, y) chunks, rendering engines yield a DensityHistogram.
+
+def _python(n, seed, size, bounds):
+    yield draw_fern(n, seed=seed)
+
+
+def _vectorized(n, seed, size, bounds):
+    yield draw_fern_vectorized(n, seed)
+
+
+def _stream(n, seed, size, bounds):
+    return iter_fern(n, seed=seed)
+
+
+def _histogram(n, seed, size, bounds):
+    yield render_fern(n, size, size, seed, bounds=bounds)
+
+
+def _parallel(n, seed, size, bounds):
+    yield render_fern_parallel(n, seed=seed, width=size, height=size, bounds=bounds)
+
+
+def _store(n, seed, size, bounds):
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'fern.npy')
+        write_fern(path, n, seed)
+        x, y = np.load(path, mmap_mode='r')
+        yield np.asarray(x), np.asarray(y)
+    finally:
+        shutil.rmtree(directory)
+
+
+def _hutchinson(n, seed, size, bounds):
+    # The operator is solved on a finer grid and summed down to the requested
+    # size: on a grid as coarse as the check one, snapping cell centres
+    # distorts the measure more than the chaos-game noise being tested for.
+    fine = render_hutchinson(width=size * HUTCHINSON_OVERSAMPLE, height=size * HUTCHINSON_OVERSAMPLE, bounds=bounds)
+    histogram = DensityHistogram(size, size, bounds, dtype=np.float64)
+    histogram.counts = fine.counts.reshape(size, HUTCHINSON_OVERSAMPLE, size, HUTCHINSON_OVERSAMPLE).sum(axis=(1, 3))
+    yield histogram
+
+
+def _adaptive(n, seed, size, bounds):
+    yield render_fern_adaptive(width=size, height=size, seed=seed, bounds=bounds)
+
+
+def _tiles(n, seed, size, bounds):
+    yield TileRenderer(tile_size=size, seed=seed or 0).tile(0, 0, 0)
+
+
+# name -> (engine, largest n run by default); None means the engine does not
+# take a point count and is run once.
+ENGINES = {
+    'python': (_python, 10 ** 6),
+    'vectorized': (_vectorized, 10 ** 7),
+    'stream': (_stream, 10 ** 8),
+    'histogram': (_histogram, 10 ** 8),
+    'parallel': (_parallel, 10 ** 8),
+    'store': (_store, 10 ** 7),
+    'hutchinson': (_hutchinson, None),
+    'adaptive': (_adaptive, None),
+    'tiles': (_tiles, None),
+}
+
+
+# tracemalloc only sees this process, so engines that do their work in
+# worker processes report no peak rather than just the parent's share.
+OUT_OF_PROCESS = {'parallel'}
+
+
+def run(engine, n, seed, size, bounds):
+    start = time.perf_counter()
+    first = None
+    result = None
+    for result in engine(n, seed, size, bounds):
+        if first is None:
+            first = time.perf_counter() - start
+    return time.perf_counter() - start, first, result
+
+
+def peak_memory(engine, n, seed, size, bounds):
+    tracemalloc.start()
+    try:
+        for _ in engine(n, seed, size, bounds):
+            pass
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def as_density(engine, seed, bounds):
+    histogram = DensityHistogram(CHECK_RESOLUTION, CHECK_RESOLUTION, bounds)
+    for item in engine(CHECK_POINTS, seed, CHECK_RESOLUTION, bounds):
+        if isinstance(item, DensityHistogram):
+            return item
+        histogram.add(*item)
+    return histogram
+
+
+def density_error(histogram, reference_x, reference_y):
+    reference = DensityHistogram(histogram.width, histogram.height, histogram.bounds)
+    reference.add(reference_x, reference_y)
+    p = histogram.counts / histogram.counts.sum()
+    q = reference.counts / reference.counts.sum()
+    return float(np.abs(p - q).sum())
+
+
+def benchmark(names, sizes, seed=0, memory=True, check=True, max_points=None):
+    bounds = ifs_bounds()
+    if check:
+        reference_x, reference_y = draw_fern(CHECK_POINTS, seed=seed + 1)
+
+    results = []
+    for name in names:
+        engine, limit = ENGINES[name]
+        if limit is not None and max_points is not None:
+            limit = max(limit, max_points)
+        for n in ([None] if limit is None else [n for n in sizes if n <= limit]):
+            seconds, first, result = run(engine, n, seed, CHECK_RESOLUTION, bounds)
+            if n is None and isinstance(result, DensityHistogram):
+                points = result.total or None
+            else:
+                points = n
+            entry = {
+                'engine': name,
+                'n': n,
+                'points': points,
+                'seconds': seconds,
+                'first_point_seconds': first,
+                'points_per_second': points / seconds if points else None,
+            }
+            if memory:
+                entry['peak_bytes'] = None
+                if name not in OUT_OF_PROCESS:
+                    entry['peak_bytes'] = peak_memory(engine, n, seed, CHECK_RESOLUTION, bounds)
+            results.append(entry)
+            print('{engine:>10} n={n!s:>10} {seconds:8.3f} s'.format(**entry), file=sys.stderr)
+
+        if check:
+            error = density_error(as_density(engine, seed, bounds), reference_x, reference_y)
+            results.append({
+                'engine': name,
+                'check': 'density_l1',
+                'error': error,
+                'tolerance': STAT_TOLERANCE,
+                'passed': error <= STAT_TOLERANCE,
+            })
+    return results
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold=REGRESSION):
+    old = {(r['engine'], r['n']): r for r in baseline['results'] if 'seconds' in r}
+    regressions = []
+    for r in results:
+        key = (r.get('engine'), r.get('n'))
+        if 'seconds' in r and key in old and r['seconds'] > old[key]['seconds'] * (1 + threshold):
+            regressions.append({'engine': key[0], 'n': key[1], 'seconds': r['seconds'],
+                                'baseline_seconds': old[key]['seconds']})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Fern_draw engines.')
+    parser.add_argument('--engines', nargs='+', choices=list(ENGINES), default=list(ENGINES))
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--max-points', type=int, default=None,
+                        help='raise the per-engine size caps up to this many points')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    parser.add_argument('--no-check', action='store_true', help='skip the density checks')
+    parser.add_argument('-o', '--output', default=None, help='write JSON results here instead of stdout')
+    parser.add_argument('--compare', default=None, help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=REGRESSION)
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.engines, args.sizes, args.seed, not args.no_memory, not args.no_check,
+                        args.max_points)
+    report = {'environment': environment(), 'results': results}
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = compare(results, json.load(f), args.threshold)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    failed = [r for r in results if r.get('passed') is False]
+    if failed or report.get('regressions'):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
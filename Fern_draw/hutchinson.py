@@ -0,0 +1,89 @@
+import numpy as np
+from ifs import BARNSLEY_FERN
+from render import HEIGHT, WIDTH, DensityHistogram, ifs_bounds
+
+TOLERANCE = 1e-6
+MAX_PASSES = 500
+
+
+class HutchinsonOperator:
+
+    def __init__(self, ifs=BARNSLEY_FERN, width=WIDTH, height=HEIGHT, bounds=None):
+        self.ifs = ifs
+        self.width = width
+        self.height = height
+        self.bounds = tuple(bounds) if bounds is not None else ifs_bounds(ifs)
+
+        x_min, x_max, y_min, y_max = self.bounds
+        dx = (x_max - x_min) / width
+        dy = (y_max - y_min) / height
+        cx = x_min + (np.arange(width) + 0.5) * dx
+        cy = y_max - (np.arange(height) + 0.5) * dy
+        x, y = [a.ravel() for a in np.meshgrid(cx, cy)]
+
+        # The grid is fixed, so where every cell centre lands under every map
+        # is computed once. Each landing point is splatted bilinearly onto its
+        # four neighbouring cells, which keeps the image smooth and conserves
+        # mass that stays inside the grid. Only the top-left neighbour and the
+        # fractional offsets are stored per map: on a grid padded by one cell
+        # the other three are fixed index offsets, and whatever lands in the
+        # padding is cropped. Points landing further out go to two spare rows
+        # at the bottom that are never read.
+        self.padded_width = width + 2
+        self.padded_size = (height + 4) * self.padded_width
+        discard = (height + 2) * self.padded_width
+        probability = ifs.probability / ifs.probability.sum()
+        self.maps = []
+        for (a, b, c, d, e, f), p in zip(ifs.coefficients, probability):
+            col = (a * x + b * y + e - x_min) / dx - 0.5
+            row = (y_max - (c * x + d * y + f)) / dy - 0.5
+            col0 = np.floor(col)
+            row0 = np.floor(row)
+            inside = (row0 >= -1) & (row0 < height) & (col0 >= -1) & (col0 < width)
+            base = np.where(inside, (row0 + 1) * self.padded_width + col0 + 1, discard).astype(np.intp)
+            self.maps.append((base, (col - col0).astype(np.float32), (row - row0).astype(np.float32), p))
+
+    def apply(self, measure):
+        flat = measure.ravel()
+        size = self.padded_size
+        out = np.zeros(size)
+        upper = np.empty_like(flat)
+        lower = np.empty_like(flat)
+        right = np.empty_like(flat)
+        for base, tc, tr, p in self.maps:
+            np.multiply(flat, p, out=upper)
+            np.multiply(upper, tr, out=lower)
+            upper -= lower
+            for row_offset, left in ((0, upper), (self.padded_width, lower)):
+                np.multiply(left, tc, out=right)
+                left -= right
+                for offset, weight in ((row_offset, left), (row_offset + 1, right)):
+                    out[offset:] += np.bincount(base, weights=weight, minlength=size)[:size - offset]
+        out = out.reshape(-1, self.padded_width)[1:self.height + 1, 1:self.width + 1]
+        total = out.sum()
+        if total > 0:
+            out = out / total
+        return out
+
+    def fixed_point(self, tol=TOLERANCE, max_passes=MAX_PASSES, measure=None):
+        if measure is None:
+            measure = np.full((self.height, self.width), 1.0 / (self.width * self.height))
+        error = np.inf
+        passes = 0
+        while passes < max_passes and error > tol:
+            updated = self.apply(measure)
+            error = np.abs(updated - measure).sum()
+            measure = updated
+            passes += 1
+        return measure, passes, error
+
+
+def render_hutchinson(ifs=BARNSLEY_FERN, width=WIDTH, height=HEIGHT, bounds=None, tol=TOLERANCE,
+                      max_passes=MAX_PASSES):
+    operator = HutchinsonOperator(ifs, width, height, bounds)
+    measure, passes, error = operator.fixed_point(tol, max_passes)
+    histogram = DensityHistogram(width, height, operator.bounds, dtype=np.float64)
+    histogram.counts = measure * (width * height)
+    histogram.passes = passes
+    histogram.error = error
+    return histogram
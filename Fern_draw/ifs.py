@@ -0,0 +1,146 @@
+import json
+import numpy as np
+
+TABLE_BITS = 16
+TABLE_TOLERANCE = 1e-3
+
+
+class AliasSampler:
+
+    def __init__(self, probability):
+        probability = np.asarray(probability, dtype=float)
+        if probability.ndim != 1 or len(probability) == 0:
+            raise ValueError('probability must be a non-empty list')
+        if np.any(probability < 0) or probability.sum() <= 0:
+            raise ValueError('probability must be non-negative with a positive sum')
+
+        k = len(probability)
+        scaled = probability * k / probability.sum()
+        self.accept = np.ones(k)
+        self.alias = np.arange(k)
+
+        small = [i for i in range(k) if scaled[i] < 1]
+        large = [i for i in range(k) if scaled[i] >= 1]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.accept[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+
+        self.size = k
+        self.table = self._lookup_table(probability)
+        if not self._table_exact(self.table, probability):
+            self.table = None
+        self._accept = self.accept.tolist()
+        self._alias = self.alias.tolist()
+
+    @staticmethod
+    def _lookup_table(probability):
+        # Quantized inverse CDF: a uniform 16-bit integer indexes straight into
+        # the map number, which is the cheapest draw for vectorized engines.
+        cdf = np.cumsum(probability) / probability.sum()
+        centers = (np.arange(1 << TABLE_BITS) + 0.5) / (1 << TABLE_BITS)
+        dtype = np.uint8 if len(probability) <= 256 else np.uint16
+        return np.searchsorted(cdf[:-1], centers, side='right').astype(dtype)
+
+    @staticmethod
+    def _table_exact(table, probability):
+        # The table rounds every map to whole 1/65536 slots, which skews many
+        # small maps badly (or drops them); keep it only when every map's
+        # share is within TABLE_TOLERANCE of its probability.
+        p = probability / probability.sum()
+        share = np.bincount(table, minlength=len(p)) / len(table)
+        used = p > 0
+        return np.all(np.abs(share[used] - p[used]) <= TABLE_TOLERANCE * p[used])
+
+    def choose(self, r):
+        r *= self.size
+        i = int(r)
+        if i >= self.size:
+            i = self.size - 1
+        if r - i < self._accept[i]:
+            return i
+        return self._alias[i]
+
+    def sample(self, rng, size):
+        r = rng.random(size) * self.size
+        i = np.minimum(r.astype(np.intp), self.size - 1)
+        r -= i
+        return np.where(r < self.accept[i], i, self.alias[i])
+
+    def sample_table(self, rng, size):
+        return self.table.take(rng.integers(0, len(self.table), size=size, dtype=np.uint16))
+
+    def draw(self, rng, size):
+        if self.table is None:
+            return self.sample(rng, size)
+        return self.sample_table(rng, size)
+
+
+class IFS:
+
+    def __init__(self, coefficients, probability, name=None):
+        self.coefficients = np.array(coefficients, dtype=float)
+        self.probability = np.array(probability, dtype=float)
+        if self.coefficients.ndim != 2 or self.coefficients.shape[1] != 6:
+            raise ValueError('each map needs six coefficients (a, b, c, d, e, f)')
+        if len(self.coefficients) != len(self.probability):
+            raise ValueError('need one probability per map')
+        self.name = name
+        self.sampler = AliasSampler(self.probability)
+        self._rows = [tuple(row) for row in self.coefficients.tolist()]
+
+    def __len__(self):
+        return len(self.coefficients)
+
+    def __repr__(self):
+        return 'IFS({0!r}, {1} maps)'.format(self.name, len(self))
+
+    def transform(self, p, index):
+        a, b, c, d, e, f = self._rows[index]
+        x, y = p
+        return a * x + b * y + e, c * x + d * y + f
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'coefficients': self.coefficients.tolist(),
+            'probability': self.probability.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['coefficients'], data['probability'], data.get('name'))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+def load_ifs(path):
+    with open(path) as f:
+        return IFS.from_dict(json.load(f))
+
+
+# Rows are (a, b, c, d, e, f) of x1 = a * x + b * y + e, y1 = c * x + d * y + f.
+BARNSLEY_FERN = IFS([
+    [0.85, 0.04, -0.04, 0.85, 0.0, 1.6],
+    [0.2, -0.26, 0.23, 0.23, 0.0, 1.6],
+    [-0.15, 0.28, 0.26, 0.24, 0.0, 0.44],
+    [0.0, 0.0, 0.0, 0.16, 0.0, 0.0],
+], [0.85, 0.07, 0.07, 0.01], 'barnsley')
+
+PRESETS = {
+    BARNSLEY_FERN.name: BARNSLEY_FERN,
+}
+
+
+def get_ifs(name_or_path):
+    if name_or_path in PRESETS:
+        return PRESETS[name_or_path]
+    return load_ifs(name_or_path)
@@ -1,77 +1,191 @@
+import argparse
 import random
-import matplotlib.pyplot as plt
-
-
-def transformation_1(p):
-    x = p[0]
-    y = p[1]
-    x1 = 0.85 * x + 0.04 * y
-    y1 = -0.04 * x + 0.85 * y + 1.6
-    return x1, y1
-
-
-def transformation_2(p):
-    x = p[0]
-    y = p[1]
-    x1 = 0.2 * x - 0.26 * y
-    y1 = 0.23 * x + 0.23 * y + 1.6
-    return x1, y1
-
-
-def transformation_3(p):
-    x = p[0]
-    y = p[1]
-    x1 = -0.15 * x + 0.28 * y
-    y1 = 0.26 * x + 0.24 * y + 0.44
-    return x1, y1
-
-
-def transformation_4(p):
-    x = p[0]
-    y = p[1]
-    x1 = 0
-    y1 = 0.16 * y
-    return x1, y1
-
-
-def get_index(probability):
-    r = random.random()
-    c_probability = 0
-    sum_probability = []
-    for p in probability:
-        c_probability += p
-        sum_probability.append(c_probability)
-    for item, sp in enumerate(sum_probability):
-        if r <= sp:
-            return item
-    return len(probability) - 1
-
-
-def transform(p):
-    transformations = [transformation_1, transformation_2, transformation_3, transformation_4]
-    probability = [0.85, 0.07, 0.07, 0.01]
-    tindex = get_index(probability)
-    t = transformations[tindex]
-    x, y = t(p)
-    return x, y
+import sys
+import numpy as np
+from ifs import BARNSLEY_FERN, get_ifs
+
+ORBITS = 4096
+BURN_IN = 20
+CHUNK_SIZE = 1 << 18
+POINTS_LIMIT = 100000
+ENGINES = ('python', 'vectorized', 'parallel', 'hutchinson')
+CMAP = 'Greens'
+
 
+def transform(p, ifs=BARNSLEY_FERN, rng=random):
+    return ifs.transform(p, ifs.sampler.choose(rng.random()))
 
-def draw_fern(n):
+
+def draw_fern(n, ifs=BARNSLEY_FERN, seed=None):
+    rng = random if seed is None else random.Random(seed)
     x = [0]
     y = [0]
 
     x1, y1 = 0, 0
     for i in range(n):
-        x1, y1 = transform((x1, y1))
+        x1, y1 = transform((x1, y1), ifs, rng)
         x.append(x1)
         y.append(y1)
     return x, y
 
 
-if __name__ == '__main__':
+def _iterate(x, y, maps, indices, out_x, out_y):
+    # One matrix product applies every map to every orbit, then two gathers
+    # pick each orbit's image: far cheaper than gathering six coefficients
+    # per point and combining them elementwise. The picks are always in
+    # range, and take() only writes straight into `out` when not raising.
+    count = len(maps) // 2
+    orbits = len(x)
+    points = np.ones((3, orbits))
+    images = np.empty((len(maps), orbits))
+    images_x = images[:count]
+    images_y = images[count:]
+    picked = np.empty(orbits, dtype=np.intp)
+    offsets = np.arange(orbits)
+    stride = np.intp(orbits)
+    points[0] = x
+    points[1] = y
+    for k, x1, y1 in zip(indices, out_x, out_y):
+        np.matmul(maps, points, out=images)
+        np.multiply(k, stride, out=picked)
+        picked += offsets
+        images_x.take(picked, out=x1, mode='clip')
+        images_y.take(picked, out=y1, mode='clip')
+        points[0] = x1
+        points[1] = y1
+
+
+class ChaosGame:
+
+    def __init__(self, seed=None, orbits=ORBITS, burn_in=BURN_IN, ifs=BARNSLEY_FERN):
+        self.rng = np.random.default_rng(seed)
+        self.ifs = ifs
+        # Rows (a, b, e) of every map, then rows (c, d, f): maps @ (x, y, 1)
+        # gives all the x images followed by all the y images.
+        self.maps = np.concatenate([ifs.coefficients[:, [0, 1, 4]], ifs.coefficients[:, [2, 3, 5]]])
+        self.x = np.zeros(orbits)
+        self.y = np.zeros(orbits)
+        if burn_in:
+            self.points(burn_in * orbits)
+
+    @property
+    def orbits(self):
+        return len(self.x)
+
+    def points(self, size):
+        steps = -(-size // self.orbits)
+        out_x = np.empty((steps, self.orbits))
+        out_y = np.empty((steps, self.orbits))
+        indices = self.ifs.sampler.draw(self.rng, (steps, self.orbits))
+        _iterate(self.x, self.y, self.maps, indices, out_x, out_y)
+        self.x = out_x[-1].copy()
+        self.y = out_y[-1].copy()
+        return out_x.ravel()[:size], out_y.ravel()[:size]
+
+    def get_state(self):
+        return {
+            'x': self.x.tolist(),
+            'y': self.y.tolist(),
+            'rng': self.rng.bit_generator.state,
+        }
+
+    def set_state(self, state):
+        self.x = np.array(state['x'], dtype=float)
+        self.y = np.array(state['y'], dtype=float)
+        self.rng.bit_generator.state = state['rng']
+
+
+def iter_fern(n=None, chunk_size=CHUNK_SIZE, seed=None, orbits=ORBITS, burn_in=BURN_IN, ifs=BARNSLEY_FERN):
+    orbits = max(1, min(orbits, chunk_size, chunk_size if n is None else n))
+    game = ChaosGame(seed, orbits, burn_in, ifs)
+    remaining = n
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        if remaining is not None:
+            remaining -= size
+        yield game.points(size)
+
+
+def draw_fern_vectorized(n, seed=None, orbits=ORBITS, burn_in=BURN_IN, ifs=BARNSLEY_FERN):
+    if n <= 0:
+        return np.empty(0), np.empty(0)
+    return next(iter_fern(n, n, seed, orbits, burn_in, ifs))
+
+
+def interactive():
+    import matplotlib.pyplot as plt
+
     n = int(input('Enter the number of points in the Fern: '))
     # n = 10000
-    x, y = draw_fern(n)
-    plt.plot(x, y, 'o')
+    if n <= POINTS_LIMIT:
+        x, y = draw_fern(n)
+        plt.plot(x, y, 'o')
+    else:
+        from render import render_fern
+        histogram = render_fern(n)
+        plt.imshow(histogram.image(), cmap=CMAP, extent=histogram.bounds)
     plt.title('Fern with {0} points'.format(n))
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Render the Barnsley fern (or any IFS) without a display.')
+    parser.add_argument('-n', '--points', type=int, default=10 ** 6,
+                        help='number of points to generate (ignored by the hutchinson engine)')
+    parser.add_argument('-s', '--seed', type=int, default=None)
+    parser.add_argument('-e', '--engine', choices=ENGINES, default='vectorized')
+    parser.add_argument('-r', '--resolution', type=int, nargs=2, default=(1024, 1024), metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('-o', '--output', required=True, help='.png for an image, .npy for raw hit counts')
+    parser.add_argument('--ifs', default=BARNSLEY_FERN.name, help='preset name or path to an IFS JSON file')
+    parser.add_argument('--scale', choices=('log', 'gamma', 'linear'), default='log')
+    parser.add_argument('--workers', type=int, default=None, help='processes for the parallel engine')
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='keep generating until the density changes by less than this (vectorized engine)')
+    parser.add_argument('--cmap', default=CMAP)
+    return parser.parse_args(argv)
+
+
+def render(args):
+    from render import DensityHistogram, ifs_bounds, render_fern, render_fern_adaptive
+
+    ifs = get_ifs(args.ifs)
+    width, height = args.resolution
+    if args.engine == 'python':
+        histogram = DensityHistogram(width, height, ifs_bounds(ifs))
+        histogram.add(*draw_fern(args.points, ifs, args.seed))
+    elif args.engine == 'hutchinson':
+        from hutchinson import render_hutchinson
+        histogram = render_hutchinson(ifs, width, height)
+    elif args.engine == 'parallel':
+        from parallel import render_fern_parallel
+        histogram = render_fern_parallel(args.points, args.workers, args.seed, width, height, ifs=ifs)
+    elif args.tolerance is not None:
+        histogram = render_fern_adaptive(args.tolerance, width, height, args.seed, ifs=ifs)
+        print('{0} points in {1:.2f} s, final error {2:.4g}'.format(
+            histogram.total, histogram.seconds, histogram.error), file=sys.stderr)
+    else:
+        histogram = render_fern(args.points, width, height, args.seed, ifs=ifs)
+    return histogram
+
+
+def save(histogram, path, scale='log', cmap=CMAP):
+    if path.endswith('.npy'):
+        np.save(path, histogram.counts)
+        return
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.imsave(path, histogram.image(scale), cmap=cmap, origin='upper')
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        interactive()
+        return
+    args = parse_args(argv)
+    save(render(args), args.output, args.scale, args.cmap)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from ifs import BARNSLEY_FERN
+from main import CHUNK_SIZE
+from render import HEIGHT, WIDTH, ifs_bounds, render_fern
+
+
+def split(n, workers):
+    base, extra = divmod(n, workers)
+    return [base + (1 if i < extra else 0) for i in range(workers)]
+
+
+def worker_seeds(seed, workers):
+    return np.random.SeedSequence(seed).spawn(workers)
+
+
+def _render_part(args):
+    n, seed, width, height, chunk_size, ifs, bounds = args
+    return render_fern(n, width, height, seed, chunk_size, ifs, bounds)
+
+
+def render_fern_parallel(n, workers=None, seed=None, width=WIDTH, height=HEIGHT, chunk_size=CHUNK_SIZE,
+                         ifs=BARNSLEY_FERN, bounds=None):
+    workers = workers or os.cpu_count() or 1
+    if bounds is None:
+        bounds = ifs_bounds(ifs)
+
+    # Every worker gets its own child of one SeedSequence, so the result only
+    # depends on (seed, workers) and not on scheduling order.
+    jobs = [(part, child, width, height, chunk_size, ifs, bounds)
+            for part, child in zip(split(n, workers), worker_seeds(seed, workers))]
+
+    if workers == 1:
+        parts = [_render_part(jobs[0])]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            parts = list(pool.map(_render_part, jobs))
+
+    histogram = parts[0]
+    for part in parts[1:]:
+        histogram.merge(part)
+    return histogram
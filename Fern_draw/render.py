@@ -0,0 +1,120 @@
+import time
+import numpy as np
+from ifs import BARNSLEY_FERN
+from main import CHUNK_SIZE, draw_fern_vectorized, iter_fern
+
+WIDTH = 1024
+HEIGHT = 1024
+GAMMA = 0.4
+TOLERANCE = 0.05
+FIRST_BATCH = 1 << 16
+MAX_POINTS = 1 << 32
+
+
+def ifs_bounds(ifs=BARNSLEY_FERN, samples=100000, margin=0.02, seed=0):
+    x, y = draw_fern_vectorized(samples, seed=seed, ifs=ifs)
+    x_min, x_max = x.min(), x.max()
+    y_min, y_max = y.min(), y.max()
+    dx = (x_max - x_min) * margin or margin
+    dy = (y_max - y_min) * margin or margin
+    return x_min - dx, x_max + dx, y_min - dy, y_max + dy
+
+
+class DensityHistogram:
+
+    def __init__(self, width=WIDTH, height=HEIGHT, bounds=None, dtype=np.uint32):
+        self.width = width
+        self.height = height
+        self.bounds = tuple(bounds) if bounds is not None else ifs_bounds()
+        self.counts = np.zeros((height, width), dtype=dtype)
+        self.total = 0
+        self.dropped = 0
+
+        x_min, x_max, y_min, y_max = self.bounds
+        self._x_scale = width / (x_max - x_min)
+        self._y_scale = height / (y_max - y_min)
+
+    def add(self, x, y, weight=None):
+        x_min, x_max, y_min, y_max = self.bounds
+        col = (np.asarray(x) - x_min) * self._x_scale
+        row = (y_max - np.asarray(y)) * self._y_scale
+        inside = (col >= 0) & (col < self.width) & (row >= 0) & (row < self.height)
+
+        # Truncation is floor for the points kept. The grid-sized bincount is
+        # added in place with an unsafe cast rather than through an astype
+        # copy of the whole grid for every chunk.
+        with np.errstate(invalid='ignore'):
+            flat = row.astype(np.intp)
+            flat *= self.width
+            flat += col.astype(np.intp)
+        flat = flat[inside]
+        hits = np.bincount(flat, minlength=self.width * self.height).reshape(self.counts.shape)
+        if weight is not None:
+            hits = hits * weight
+        np.add(self.counts, hits, out=self.counts, casting='unsafe')
+
+        self.total += len(inside)
+        self.dropped += len(inside) - len(flat)
+
+    def merge(self, other):
+        if other.counts.shape != self.counts.shape or other.bounds != self.bounds:
+            raise ValueError('can only merge histograms with the same shape and bounds')
+        self.counts += other.counts
+        self.total += other.total
+        self.dropped += other.dropped
+
+    def image(self, scale='log', gamma=GAMMA):
+        return scale_image(self.counts, scale, gamma)
+
+
+def scale_image(counts, scale='log', gamma=GAMMA):
+    counts = np.asarray(counts, dtype=float)
+    peak = counts.max()
+    if peak == 0:
+        return counts
+    if scale == 'log':
+        return np.log1p(counts) / np.log1p(peak)
+    if scale == 'gamma':
+        return (counts / peak) ** gamma
+    if scale == 'linear':
+        return counts / peak
+    raise ValueError('unknown scale: {0}'.format(scale))
+
+
+def render_fern(n, width=WIDTH, height=HEIGHT, seed=None, chunk_size=CHUNK_SIZE, ifs=BARNSLEY_FERN, bounds=None):
+    if bounds is None:
+        bounds = ifs_bounds(ifs)
+    histogram = DensityHistogram(width, height, bounds)
+    for x, y in iter_fern(n, chunk_size, seed, ifs=ifs):
+        histogram.add(x, y)
+    return histogram
+
+
+def render_fern_adaptive(tol=TOLERANCE, width=WIDTH, height=HEIGHT, seed=None, chunk_size=CHUNK_SIZE,
+                         ifs=BARNSLEY_FERN, bounds=None, first_batch=FIRST_BATCH, max_points=MAX_POINTS):
+    # Points are generated in doubling batches. After each batch the normalized
+    # density is compared with the snapshot from before it; with doubling,
+    # that L1 distance tracks the sampling noise left in the image rather than
+    # just shrinking because the batch is a smaller share of the total.
+    start = time.perf_counter()
+    if bounds is None:
+        bounds = ifs_bounds(ifs)
+    histogram = DensityHistogram(width, height, bounds)
+    stream = iter_fern(None, chunk_size, seed, ifs=ifs)
+    previous = None
+    error = np.inf
+    target = first_batch
+    while histogram.total < max_points:
+        while histogram.total < target:
+            x, y = next(stream)
+            histogram.add(x, y)
+        current = histogram.counts / max(histogram.counts.sum(), 1)
+        if previous is not None:
+            error = np.abs(current - previous).sum()
+            if error <= tol:
+                break
+        previous = current
+        target = min(2 * histogram.total, max_points)
+    histogram.error = error
+    histogram.seconds = time.perf_counter() - start
+    return histogram
@@ -0,0 +1,73 @@
+import json
+import os
+import numpy as np
+from ifs import BARNSLEY_FERN, IFS
+from main import BURN_IN, CHUNK_SIZE, ORBITS, ChaosGame
+
+
+def checkpoint_path(path):
+    return path + '.ckpt.json'
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp = checkpoint_path(path) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, checkpoint_path(path))
+
+
+def load_checkpoint(path):
+    try:
+        with open(checkpoint_path(path)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_fern(path, n, seed=None, chunk_size=CHUNK_SIZE, orbits=ORBITS, burn_in=BURN_IN, ifs=BARNSLEY_FERN,
+               dtype=np.float32, resume=True):
+    checkpoint = load_checkpoint(path) if resume else None
+
+    if checkpoint is None:
+        orbits = max(1, min(orbits, chunk_size, n))
+        game = ChaosGame(seed, orbits, burn_in, ifs)
+        points = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(2, n))
+        checkpoint = {'n': n, 'written': 0, 'ifs': ifs.to_dict()}
+    else:
+        if checkpoint['n'] != n:
+            raise ValueError('{0} was started with n={1}, not n={2}'.format(path, checkpoint['n'], n))
+        game = ChaosGame(None, len(checkpoint['state']['x']), 0, IFS.from_dict(checkpoint['ifs']))
+        game.set_state(checkpoint['state'])
+        points = np.load(path, mmap_mode='r+')
+
+    # The checkpoint is only replaced after the chunk it describes has been
+    # flushed, so an interrupted run resumes with exactly the same stream.
+    written = checkpoint['written']
+    while written < n:
+        size = min(chunk_size, n - written)
+        x, y = game.points(size)
+        points[0, written:written + size] = x
+        points[1, written:written + size] = y
+        points.flush()
+        written += size
+        checkpoint['written'] = written
+        checkpoint['state'] = game.get_state()
+        _save_checkpoint(path, checkpoint)
+
+    del points
+    return written
+
+
+def read_fern(path):
+    points = np.load(path, mmap_mode='r')
+    checkpoint = load_checkpoint(path)
+    written = points.shape[1] if checkpoint is None else checkpoint['written']
+    return points[0, :written], points[1, :written]
+
+
+def iter_store(path, chunk_size=CHUNK_SIZE):
+    x, y = read_fern(path)
+    for start in range(0, len(x), chunk_size):
+        yield x[start:start + chunk_size], y[start:start + chunk_size]
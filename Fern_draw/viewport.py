@@ -0,0 +1,162 @@
+import heapq
+from collections import OrderedDict
+import numpy as np
+from ifs import BARNSLEY_FERN
+from main import BURN_IN, ChaosGame
+from render import GAMMA, DensityHistogram, ifs_bounds, scale_image
+
+TILE_SIZE = 256
+TILE_SAMPLES = 1 << 20
+CACHE_SIZE = 256
+MAX_PIECES = 4096
+MIN_WEIGHT = 1e-12
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def compose(outer, inner):
+    a1, b1, c1, d1, e1, f1 = outer
+    a2, b2, c2, d2, e2, f2 = inner
+    return (a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+            c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+            a1 * e2 + b1 * f2 + e1, c1 * e2 + d1 * f2 + f1)
+
+
+def map_box(row, bounds):
+    a, b, c, d, e, f = row
+    x_min, x_max, y_min, y_max = bounds
+    xs = [a * x + b * y + e for x in (x_min, x_max) for y in (y_min, y_max)]
+    ys = [c * x + d * y + f for x in (x_min, x_max) for y in (y_min, y_max)]
+    return min(xs), max(xs), min(ys), max(ys)
+
+
+def intersects(box, view):
+    return box[0] <= view[1] and box[1] >= view[0] and box[2] <= view[3] and box[3] >= view[2]
+
+
+def pieces(view, size, ifs=BARNSLEY_FERN, bounds=None, max_pieces=MAX_PIECES, min_weight=MIN_WEIGHT):
+    # The attractor is the union of its images under every composition of the
+    # maps. Only compositions whose image of the bounding box meets the view
+    # can put points there, so subdivide those (largest first) until each is
+    # about the size of the view and drop the rest.
+    if bounds is None:
+        bounds = ifs_bounds(ifs)
+    rows = [tuple(row) for row in ifs.coefficients.tolist()]
+    probability = (ifs.probability / ifs.probability.sum()).tolist()
+
+    heap = [(0.0, 0, IDENTITY, 1.0)]
+    leaves = []
+    counter = 1
+    while heap:
+        _, _, row, weight = heapq.heappop(heap)
+        box = map_box(row, bounds)
+        extent = max(box[1] - box[0], box[3] - box[2])
+        if extent <= size or len(heap) + len(leaves) + len(rows) > max_pieces:
+            leaves.append((row, weight))
+            continue
+        for child, p in zip(rows, probability):
+            child_row = compose(row, child)
+            child_weight = weight * p
+            if child_weight < min_weight or not intersects(map_box(child_row, bounds), view):
+                continue
+            child_box = map_box(child_row, bounds)
+            heapq.heappush(heap, (-max(child_box[1] - child_box[0], child_box[3] - child_box[2]),
+                                  counter, child_row, child_weight))
+            counter += 1
+    return leaves
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            self.hits += 1
+            return self.items[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.maxsize:
+            self.items.popitem(last=False)
+
+
+class TileRenderer:
+
+    def __init__(self, ifs=BARNSLEY_FERN, tile_size=TILE_SIZE, samples=TILE_SAMPLES, cache_size=CACHE_SIZE, seed=0):
+        self.ifs = ifs
+        self.tile_size = tile_size
+        self.samples = samples
+        self.seed = seed
+        self.cache = LRUCache(cache_size)
+
+        # Tiles are square in world units so zooming keeps the aspect ratio.
+        self.bounds = ifs_bounds(ifs)
+        x_min, x_max, y_min, y_max = self.bounds
+        side = max(x_max - x_min, y_max - y_min)
+        cx = (x_min + x_max) / 2
+        cy = (y_min + y_max) / 2
+        self.world = (cx - side / 2, cx + side / 2, cy - side / 2, cy + side / 2)
+        self.side = side
+
+    def tile_bounds(self, zoom, tx, ty):
+        size = self.side / (1 << zoom)
+        x_min = self.world[0] + tx * size
+        y_max = self.world[3] - ty * size
+        return x_min, x_min + size, y_max - size, y_max
+
+    def tile(self, zoom, tx, ty):
+        key = (zoom, tx, ty)
+        histogram = self.cache.get(key)
+        if histogram is None:
+            histogram = self._render_tile(zoom, tx, ty)
+            self.cache.put(key, histogram)
+        return histogram
+
+    def _render_tile(self, zoom, tx, ty):
+        view = self.tile_bounds(zoom, tx, ty)
+        histogram = DensityHistogram(self.tile_size, self.tile_size, view, dtype=np.float64)
+        leaves = pieces(view, view[1] - view[0], self.ifs, self.bounds)
+        if not leaves:
+            return histogram
+
+        # One burnt-in pool of attractor points, pushed through every piece.
+        # Weights are in units of the uniform density at this zoom, so tiles
+        # of the same zoom stitch without seams.
+        pool = max(1024, self.samples // len(leaves))
+        seed = np.random.SeedSequence([self.seed, zoom, tx, ty])
+        x, y = ChaosGame(seed, min(pool, 4096), BURN_IN, self.ifs).points(pool)
+        pixels = (self.tile_size << zoom) ** 2
+        for row, weight in leaves:
+            a, b, c, d, e, f = row
+            histogram.add(a * x + b * y + e, c * x + d * y + f, weight * pixels / pool)
+        return histogram
+
+    def view(self, zoom, tx0, ty0, tx1, ty1):
+        rows = []
+        for ty in range(ty0, ty1 + 1):
+            rows.append(np.hstack([self.tile(zoom, tx, ty).counts for tx in range(tx0, tx1 + 1)]))
+        return np.vstack(rows)
+
+    def image(self, zoom, tx0, ty0, tx1, ty1, scale='log', gamma=GAMMA):
+        return scale_image(self.view(zoom, tx0, ty0, tx1, ty1), scale, gamma)
+
+    def tiles_at(self, zoom, x, y, width=1, height=1):
+        size = self.side / (1 << zoom)
+        tx = int((x - self.world[0]) // size)
+        ty = int((self.world[3] - y) // size)
+        return tx - width // 2, ty - height // 2, tx + (width - 1) // 2, ty + (height - 1) // 2
@@ -0,0 +1,169 @@
+import argparse
+import heapq
+import time
+from collections import deque
+from engine import DIED, DIRECTIONS, DIRECTION_ACTIONS, NOOP, SnakeEngine
+
+RETRY_TICKS = 8
+
+
+class Autopilot:
+
+    def __init__(self, engine, retry_ticks=RETRY_TICKS):
+        self.engine = engine
+        self.retry_ticks = retry_ticks
+        self.path = deque()
+        self.target = None
+        self.wait = 0
+        self.plans = 0
+        self.expanded = 0
+
+    def neighbours(self, cell):
+        x, y = cell
+        columns = self.engine.columns
+        rows = self.engine.rows
+        for dx, dy in DIRECTIONS.values():
+            yield ((x + dx) % columns, (y + dy) % rows)
+
+    def distance(self, a, b):
+        # Manhattan distance, on the torus when the board wraps. With walls on
+        # the border is static, so the wrap-around is unreachable and would
+        # make the estimate far too low.
+        dx = abs(a[0] - b[0])
+        dy = abs(a[1] - b[1])
+        if self.engine.walls:
+            return dx + dy
+        return min(dx, self.engine.columns - dx) + min(dy, self.engine.rows - dy)
+
+    def plan(self):
+        # A* from the head to the food. A body cell is not a permanent wall:
+        # the segment k cells from the head leaves after len(body) - k ticks,
+        # so the search may enter it from that step on.
+        engine = self.engine
+        head = engine.head()
+        food = engine.food
+        self.plans += 1
+        self.path.clear()
+        self.target = food
+        if food is None:
+            return False
+
+        body = engine.body
+        length = len(body)
+        leaves = {}
+        for k, cell in enumerate(body):
+            leaves[cell] = max(leaves.get(cell, 0), length - k)
+        behind = body[1] if length > 1 else None
+
+        parents = {head: None}
+        steps = {head: 0}
+        # Ties on f go to the deepest node (-g): with a consistent estimate
+        # every cell in the head-food rectangle shares one f, and breaking
+        # ties the other way expands all of them.
+        queue = [(self.distance(head, food), 0, head)]
+        while queue:
+            _, g, cell = heapq.heappop(queue)
+            g = -g
+            if cell == food:
+                break
+            if g > steps[cell]:
+                continue
+            self.expanded += 1
+            g += 1
+            for nxt in self.neighbours(cell):
+                if nxt == behind and cell == head:
+                    continue
+                if engine.static[engine.index(nxt)] or leaves.get(nxt, 0) > g:
+                    continue
+                if g < steps.get(nxt, g + 1):
+                    steps[nxt] = g
+                    parents[nxt] = cell
+                    heapq.heappush(queue, (g + self.distance(nxt, food), -g, nxt))
+        else:
+            return False
+
+        cell = food
+        while cell != head:
+            self.path.appendleft(cell)
+            cell = parents[cell]
+        return True
+
+    def valid(self):
+        if not self.path or self.target != self.engine.food:
+            return False
+        return self.adjacent(self.engine.head(), self.path[0]) and not self.engine.collides(self.path[0])
+
+    def adjacent(self, a, b):
+        return self.distance(a, b) == 1
+
+    def action(self):
+        # The cached path stays valid by construction (the body only vacates
+        # cells it counted on), so planning only happens when the food moved,
+        # the snake left the path, or the next cell turned out blocked.
+        if not self.valid():
+            if self.wait > 0:
+                self.wait -= 1
+                self.path.clear()
+            elif not self.plan():
+                self.wait = self.retry_ticks
+        if self.path:
+            return self.towards(self.path.popleft())
+        return self.survive()
+
+    def towards(self, cell):
+        x, y = self.engine.head()
+        dx = (cell[0] - x + 1) % self.engine.columns - 1
+        dy = (cell[1] - y + 1) % self.engine.rows - 1
+        return DIRECTION_ACTIONS[(dx, dy)]
+
+    def survive(self):
+        # No route to the food: take the free neighbour with the most free
+        # neighbours of its own, preferring to keep going straight.
+        engine = self.engine
+        head = engine.head()
+        x, y = head
+        best = None
+        best_score = -1
+        for action, (dx, dy) in DIRECTIONS.items():
+            if (dx, dy) == (-engine.direction[0], -engine.direction[1]):
+                continue
+            cell = ((x + dx) % engine.columns, (y + dy) % engine.rows)
+            if engine.collides(cell) and cell != engine.body[-1]:
+                continue
+            score = sum(1 for n in self.neighbours(cell) if not engine.collides(n)) * 2
+            score += (dx, dy) == engine.direction
+            if score > best_score:
+                best = action
+                best_score = score
+        return NOOP if best is None else best
+
+
+def play(engine, pilot=None, max_ticks=None):
+    pilot = pilot if pilot is not None else Autopilot(engine)
+    while engine.alive and (max_ticks is None or engine.ticks < max_ticks):
+        if engine.step(pilot.action()) & DIED:
+            break
+    return pilot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play headless snake games with the autopilot.')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--columns', type=int, default=32)
+    parser.add_argument('--rows', type=int, default=20)
+    parser.add_argument('--max-ticks', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    for game in range(args.games):
+        engine = SnakeEngine(args.columns, args.rows, seed=args.seed + game)
+        start = time.perf_counter()
+        pilot = play(engine, max_ticks=args.max_ticks)
+        elapsed = time.perf_counter() - start
+        print('game {0}: score {1}, ticks {2}, plans {3}, expanded/tick {4:.1f}, {5:.1f} us/tick'.format(
+            game, engine.score, engine.ticks, pilot.plans, pilot.expanded / max(engine.ticks, 1),
+            elapsed / max(engine.ticks, 1) * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from collections import deque
+from autopilot import Autopilot
+from engine import DIRECTIONS, DIRECTION_ACTIONS, SnakeEngine
+from replay import Recorder, ReplayPlayer
+
+LENGTHS = [10, 100, 1000, 10000]
+RENDER_LENGTHS = [10, 100, 1000]
+TICKS = 5000
+FRAMES = 600
+BOARD = 200
+VECTOR_GAMES = 256
+REGRESSION = 0.2
+PERCENTILES = (50, 95, 99)
+
+
+def hamiltonian_cycle(columns, rows):
+    # Row 0 left to right, a serpentine over columns 1.. for the other rows,
+    # then back up column 0. Needs an even number of rows.
+    cycle = [(x, 0) for x in range(columns)]
+    for y in range(1, rows):
+        xs = range(columns - 1, 0, -1) if y % 2 else range(1, columns)
+        cycle.extend((x, y) for x in xs)
+    cycle.extend((0, y) for y in range(rows - 1, 0, -1))
+    return cycle
+
+
+def step_action(a, b, columns, rows):
+    dx = (b[0] - a[0] + 1) % columns - 1
+    dy = (b[1] - a[1] + 1) % rows - 1
+    return DIRECTION_ACTIONS[(dx, dy)]
+
+
+def place_snake(engine, length):
+    # Lays a snake of `length` along a Hamiltonian cycle of an open board and
+    # returns the action to take on every cell: following the cycle never
+    # dies, so each length is a fixed, repeatable workload.
+    cycle = hamiltonian_cycle(engine.columns, engine.rows)
+    for cell in engine.body:
+        engine.occupied[engine.index(cell)] -= 1
+        engine.free.add(cell)
+    engine.body = deque(reversed(cycle[:length]))
+    for cell in engine.body:
+        engine.occupied[engine.index(cell)] += 1
+        engine.free.discard(cell)
+    engine.direction = DIRECTIONS[step_action(engine.body[1], engine.body[0], engine.columns, engine.rows)]
+    if engine.occupied[engine.index(engine.food)]:
+        engine.food = engine.spawn()
+    if engine.occupied[engine.index(engine.mistake)]:
+        engine.mistake = engine.spawn()
+    return {cell: step_action(cell, cycle[(i + 1) % len(cycle)], engine.columns, engine.rows)
+            for i, cell in enumerate(cycle)}
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    return {'p{0}'.format(q): ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * 1e6
+            for q in PERCENTILES}
+
+
+def timed(steps, count):
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        t = time.perf_counter()
+        steps()
+        latencies.append(time.perf_counter() - t)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'latency_us': percentiles(latencies)}
+
+
+def allocations(steps, count):
+    # A separate untimed pass: memory blocks still allocated per call, the
+    # gen-0 collections the calls triggered and the largest per-call peak.
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    collections = gc.get_stats()[0]['collections']
+    for _ in range(count):
+        steps()
+    result = {
+        'allocated_blocks_per_call': (sys.getallocatedblocks() - blocks) / count,
+        'gc_collections': gc.get_stats()[0]['collections'] - collections,
+    }
+    tracemalloc.start()
+    try:
+        peak = 0
+        for _ in range(count):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            steps()
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    finally:
+        tracemalloc.stop()
+    result['peak_bytes_per_call'] = peak
+    return result
+
+
+# Each workload takes (length, ticks, frames, seed) and returns a result
+# dict; `length` is None for workloads that are not run per length.
+
+def _engine(length, ticks, frames, seed):
+    engine = SnakeEngine(BOARD, BOARD, walls=False, obstacles=0, seed=seed)
+    actions = place_snake(engine, length)
+
+    def steps():
+        engine.step(actions[engine.body[0]])
+
+    result = timed(steps, ticks)
+    result.update(allocations(steps, min(ticks, 1000)))
+    result.update({'ticks': ticks, 'ticks_per_second': ticks / result['seconds'],
+                   'check': 'survived', 'passed': engine.alive})
+    return result
+
+
+def _autopilot(length, ticks, frames, seed):
+    engine = SnakeEngine(BOARD // 4, BOARD // 4, seed=seed)
+    pilot = Autopilot(engine)
+    recorder = Recorder(engine)
+
+    def steps():
+        if engine.alive:
+            engine.step(pilot.action())
+            recorder.record()
+
+    result = timed(steps, ticks)
+    result.update({'ticks': engine.ticks, 'ticks_per_second': engine.ticks / result['seconds'],
+                   'score': engine.score, 'plans': pilot.plans})
+    result.update(allocations(steps, min(ticks, 1000)))
+
+    # Re-simulating the recorded game must land on the same state.
+    start = time.perf_counter()
+    replayed = ReplayPlayer(recorder.replay).run()
+    result['replay_seconds'] = time.perf_counter() - start
+    result['check'] = 'replay_matches'
+    result['passed'] = (replayed.score, replayed.head(), replayed.ticks) == (engine.score, engine.head(),
+                                                                           engine.ticks)
+    return result
+
+
+def _vector(length, ticks, frames, seed):
+    import numpy as np
+    from vec_env import VectorSnakeEnv
+    env = VectorSnakeEnv(VECTOR_GAMES, seed=seed)
+    rng = np.random.default_rng(seed)
+    actions = rng.integers(0, 5, size=(ticks, VECTOR_GAMES))
+    tick = [0]
+
+    def steps():
+        env.step(actions[tick[0] % ticks])
+        tick[0] += 1
+
+    result = timed(steps, ticks)
+    result.update({'ticks': ticks * VECTOR_GAMES, 'ticks_per_second': ticks * VECTOR_GAMES / result['seconds'],
+                   'games': VECTOR_GAMES})
+    result.update(allocations(steps, min(ticks, 1000)))
+    return result
+
+
+def _render(length, ticks, frames, seed):
+    # SDL's dummy driver renders to an off-screen surface, so frames cost the
+    # same blits as on a display without needing one.
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    from level import Level
+    from main import RENDER_RATE, TICK_RATE, App
+    app = App(level=Level(), columns=BOARD, rows=BOARD, replay_dir=None)
+    app.walls_toggle = False
+    app.new_game(seed)
+    actions = place_snake(app.engine, length)
+    app.food.place(*app.cell_position(app.engine.food))
+    app.mistake.place(*app.cell_position(app.engine.mistake))
+    app.render(1.0)
+
+    # One tick per RENDER_RATE / TICK_RATE frames, as in PlayScene.
+    per_tick = max(1, RENDER_RATE // TICK_RATE)
+    frame = [0]
+
+    def steps():
+        if frame[0] % per_tick == 0:
+            app.turns.push(actions[app.engine.body[0]], app.engine.direction)
+            app.step()
+        app.render((frame[0] % per_tick) / per_tick)
+        frame[0] += 1
+
+    result = timed(steps, frames)
+    result.update(allocations(steps, min(frames, 200)))
+    result.update({'frames': frames, 'frames_per_second': frames / result['seconds'],
+                   'check': 'survived', 'passed': app.engine.alive})
+    return result
+
+
+# name -> (workload, lengths it runs at by default); None means the workload
+# does not take a snake length and is run once.
+WORKLOADS = {
+    'engine': (_engine, LENGTHS),
+    'autopilot': (_autopilot, None),
+    'vector': (_vector, None),
+    'render': (_render, RENDER_LENGTHS),
+}
+
+
+def benchmark(names, lengths=None, ticks=TICKS, frames=FRAMES, seed=0):
+    results = []
+    for name in names:
+        workload, default = WORKLOADS[name]
+        if default is None:
+            runs = [None]
+        else:
+            runs = [n for n in (lengths or default) if n < BOARD * BOARD]
+        for length in runs:
+            entry = {'workload': name, 'length': length}
+            entry.update(workload(length, ticks, frames, seed))
+            results.append(entry)
+            print('{workload:>10} length={length!s:>6} {seconds:8.3f} s'.format(**entry), file=sys.stderr)
+    return results
+
+
+def environment():
+    env = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+    for module in ('numpy', 'pygame'):
+        if module in sys.modules:
+            env[module] = sys.modules[module].__version__ if module == 'numpy' else sys.modules[module].version.ver
+    return env
+
+
+def per_call(result):
+    return result['seconds'] / (result.get('frames') or result['ticks'])
+
+
+def compare(results, baseline, threshold=REGRESSION):
+    # Compared per tick or frame, so runs with different --ticks/--frames
+    # still line up.
+    old = {(r['workload'], r['length']): per_call(r) for r in baseline['results'] if 'seconds' in r}
+    regressions = []
+    for r in results:
+        key = (r.get('workload'), r.get('length'))
+        if 'seconds' in r and key in old and per_call(r) > old[key] * (1 + threshold):
+            regressions.append({'workload': key[0], 'length': key[1], 'seconds_per_call': per_call(r),
+                                'baseline_seconds_per_call': old[key]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Snake simulation and rendering.')
+    parser.add_argument('--workloads', nargs='+', choices=list(WORKLOADS), default=list(WORKLOADS))
+    parser.add_argument('--lengths', type=int, nargs='+', default=None,
+                        help='snake lengths for the per-length workloads (default: their own lists)')
+    parser.add_argument('--ticks', type=int, default=TICKS)
+    parser.add_argument('--frames', type=int, default=FRAMES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help='write JSON results here instead of stdout')
+    parser.add_argument('--compare', default=None, help='baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=REGRESSION)
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.workloads, args.lengths, args.ticks, args.frames, args.seed)
+    report = {'environment': environment(), 'results': results}
+    if args.compare:
+        with open(args.compare) as f:
+            report['regressions'] = compare(results, json.load(f), args.threshold)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    failed = [r for r in results if r.get('passed') is False]
+    if failed or report.get('regressions'):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
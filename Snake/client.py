@@ -0,0 +1,129 @@
+import argparse
+import asyncio
+import pygame
+from main import (DARK_BLUE, DARK_GREEN, GREEN, KEY_ACTIONS, RED, RENDER_RATE, SCORE_BOARD_HEIGHT, SEGMENT_SIZE,
+                  YELLOW, App, Ob, tile_surface)
+from protocol import (DELTA, HOST, PORT, SNAPSHOT, WELCOME, ClientState, decode_delta, decode_json, encode_turn, frame,
+                      read_frame)
+
+
+class NetApp(App):
+
+    def __init__(self, host=HOST, port=PORT, width=800, height=600):
+        super().__init__(width, height, replay_dir=None)
+        self.host = host
+        self.port = port
+        self.state = None
+        self.writer = None
+        self.connected = False
+        pygame.display.set_caption('Змейка — {0}:{1}'.format(host, port))
+
+    def setup(self, welcome):
+        # The server owns the game; the client mirrors it in a ClientState
+        # and reuses App's viewport, camera and chunked background to draw it.
+        self.state = ClientState(welcome)
+        self.engine = self.state
+        self.walls_toggle = self.state.walls
+        self.score = 0
+        self.render_score()
+        self.viewport = pygame.Rect(0, SCORE_BOARD_HEIGHT, self.screen_width, self.screen_height - SCORE_BOARD_HEIGHT)
+        self.board_width = self.state.columns * SEGMENT_SIZE
+        self.board_height = self.state.rows * SEGMENT_SIZE
+        self.camera = (0, 0)
+        self.obstacles = {}
+        for cell in self.state.obstacles:
+            self.obstacles.setdefault(self.chunk_key(cell), []).append(Ob(*self.cell_position(cell)))
+        if self.walls_toggle:
+            self.walls = self.build_walls(YELLOW)
+        self.compose_background(YELLOW)
+
+    def visible(self, cell, bounds):
+        x0, y0, x1, y1 = bounds
+        return x0 <= cell[0] < x1 and y0 <= cell[1] < y1
+
+    def draw(self):
+        state = self.state
+        head = state.head()
+        if head is not None:
+            self.follow(pygame.Rect(self.cell_position(head), self.cell_rect(head).size))
+        if state.scores.get(state.player, self.score) != self.score:
+            self.score = state.scores[state.player]
+            self.render_score()
+
+        self.screen.set_clip(self.viewport)
+        self.restore(self.viewport)
+        bounds = self.visible_cells()
+        food = tile_surface(RED)
+        for cell in state.food:
+            if self.visible(cell, bounds):
+                self.screen.blit(food, self.cell_rect(cell))
+
+        # Other snakes come from the occupancy grid over the visible cells,
+        # the player's own snake is drawn on top in its own colour.
+        x0, y0, x1, y1 = bounds
+        other = tile_surface(DARK_BLUE)
+        for y in range(y0, y1):
+            row = y * state.columns
+            for x in range(x0, x1):
+                if state.occupied[row + x]:
+                    self.screen.blit(other, self.cell_rect((x, y)))
+        own = tile_surface(DARK_GREEN)
+        for cell in state.snakes.get(state.player, ()):
+            if self.visible(cell, bounds):
+                self.screen.blit(own, self.cell_rect(cell))
+        if head is not None:
+            pygame.draw.rect(self.screen, GREEN, self.cell_rect(head), 1)
+        self.screen.set_clip(None)
+        self.screen.blit(self.score_board, (0, 0))
+        pygame.display.update()
+
+    async def receive(self, reader):
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload[0] == SNAPSHOT:
+                    self.state.apply_snapshot(decode_json(payload))
+                elif payload[0] == DELTA:
+                    self.state.apply_delta(decode_delta(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.connected = False
+
+    async def play(self):
+        reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = await read_frame(reader)
+        if payload[0] != WELCOME:
+            raise ConnectionError('unexpected first message from {0}:{1}'.format(self.host, self.port))
+        self.setup(decode_json(payload))
+        self.connected = True
+        receiver = asyncio.ensure_future(self.receive(reader))
+
+        # Input goes straight to the server; the screen is redrawn only when a
+        # new tick has arrived.
+        drawn = -1
+        try:
+            while self.connected:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        self.connected = False
+                    if event.type == pygame.VIDEOEXPOSE:
+                        drawn = -1
+                    if event.type == pygame.KEYDOWN and event.key in KEY_ACTIONS:
+                        self.writer.write(frame(encode_turn(KEY_ACTIONS[event.key])))
+                if self.state.tick != drawn:
+                    drawn = self.state.tick
+                    self.draw()
+                await asyncio.sleep(1.0 / RENDER_RATE)
+        finally:
+            receiver.cancel()
+            self.writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Join a multiplayer snake server.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    asyncio.run(NetApp(args.host, args.port).play())
+    pygame.quit()
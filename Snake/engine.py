@@ -0,0 +1,232 @@
+import random
+from collections import deque
+from itertools import islice
+from level import FreeCells, Level
+
+COLUMNS = 32
+ROWS = 20
+OBSTACLES = 9
+START_LENGTH = 2
+INPUT_BUFFER = 3
+
+NOOP = 0
+UP = 1
+DOWN = 2
+LEFT = 3
+RIGHT = 4
+
+DIRECTIONS = {
+    UP: (0, -1),
+    DOWN: (0, 1),
+    LEFT: (-1, 0),
+    RIGHT: (1, 0),
+}
+DIRECTION_ACTIONS = {direction: action for action, direction in DIRECTIONS.items()}
+
+ATE = 1
+MISTAKE = 2
+DIED = 4
+
+
+class TurnBuffer:
+
+    def __init__(self, size=INPUT_BUFFER):
+        self.size = size
+        self.actions = deque()
+
+    def push(self, action, direction):
+        # A turn is checked against the direction the snake will have after
+        # the turns already queued, so a quick "up, left" both survive.
+        if self.actions:
+            direction = DIRECTIONS[self.actions[-1]]
+        dx, dy = DIRECTIONS[action]
+        if len(self.actions) < self.size and (dx, dy) != direction and (dx, dy) != (-direction[0], -direction[1]):
+            self.actions.append(action)
+
+    def pop(self):
+        return self.actions.popleft() if self.actions else NOOP
+
+    def clear(self):
+        self.actions.clear()
+
+
+class SnakeEngine:
+
+    def __init__(self, columns=COLUMNS, rows=ROWS, walls=True, obstacles=OBSTACLES, start_length=START_LENGTH,
+                 seed=None, level=None):
+        if level is None:
+            level = Level(random_obstacles=obstacles)
+        if not level.fits(columns, rows):
+            raise ValueError('level {0!r} does not fit a {1}x{2} board'.format(level.name, columns, rows))
+        self.columns = columns
+        self.rows = rows
+        self.walls = walls
+        self.level = level
+        self.obstacle_count = len(level.obstacles) + level.random_obstacles
+        self.start_length = start_length
+
+        # The walls are the same for every round, so the empty board is built
+        # once and copied on reset.
+        self.static = bytearray(columns * rows)
+        self.free = FreeCells((x, y) for y in range(rows) for x in range(columns))
+        if walls:
+            for x in range(columns):
+                self.block((x, 0))
+                self.block((x, rows - 1))
+            for y in range(rows):
+                self.block((0, y))
+                self.block((columns - 1, y))
+        self.empty_static = bytes(self.static)
+        self.empty_free = self.free
+
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        if seed is None:
+            seed = random.randrange(1 << 63)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.score = 0
+        self.ticks = 0
+        self.alive = True
+
+        # Walls and obstacles never move, so they live in one byte per cell;
+        # the body keeps a separate per-cell count so that a segment sitting on
+        # a wall cell (the initial tail does) never clears the wall.
+        self.static = bytearray(self.empty_static)
+        self.occupied = bytearray(self.columns * self.rows)
+        self.free = self.empty_free.copy()
+
+        self.body = deque()
+        for i in range(self.start_length):
+            cell = ((1 - i) % self.columns, 1)
+            self.body.append(cell)
+            self.occupied[self.index(cell)] += 1
+            self.free.discard(cell)
+        self.direction = DIRECTIONS[RIGHT]
+        self.last_removed = None
+
+        # Everything spawns from the free-cell index, so nothing lands on the
+        # snake, a wall or another item, however full the board is.
+        # The cell in front of the head is held back while random obstacles
+        # spawn, so no round is lost on its first tick (VectorSnakeEnv does
+        # the same).
+        self.obstacles = sorted(self.level.obstacles)
+        for cell in self.obstacles:
+            self.block(cell)
+        front = (2 % self.columns, 1)
+        reserved = front in self.free
+        self.free.discard(front)
+        for _ in range(self.level.random_obstacles):
+            cell = self.spawn()
+            if cell is None:
+                break
+            self.block(cell)
+            self.obstacles.append(cell)
+        if reserved:
+            self.free.add(front)
+        self.food = self.spawn()
+        self.mistake = self.spawn()
+        return self
+
+    def get_state(self):
+        return {
+            'rng': self.rng.getstate(),
+            'score': self.score,
+            'ticks': self.ticks,
+            'alive': self.alive,
+            'occupied': bytes(self.occupied),
+            'free': list(self.free.cells),
+            'body': list(self.body),
+            'direction': self.direction,
+            'last_removed': self.last_removed,
+            'obstacles': list(self.obstacles),
+            'food': self.food,
+            'mistake': self.mistake,
+        }
+
+    def set_state(self, state):
+        self.rng.setstate(state['rng'])
+        self.score = state['score']
+        self.ticks = state['ticks']
+        self.alive = state['alive']
+        # Only the free cells' order is stored: their index and the static
+        # grid (the empty board plus the obstacles) are rebuilt from it.
+        self.static = bytearray(self.empty_static)
+        for cell in state['obstacles']:
+            self.static[self.index(cell)] = 1
+        self.occupied = bytearray(state['occupied'])
+        self.free = FreeCells.from_list(state['free'])
+        self.body = deque(state['body'])
+        self.direction = state['direction']
+        self.last_removed = state['last_removed']
+        self.obstacles = list(state['obstacles'])
+        self.food = state['food']
+        self.mistake = state['mistake']
+
+    def block(self, cell):
+        self.static[self.index(cell)] = 1
+        self.free.discard(cell)
+
+    def index(self, cell):
+        return (cell[1] % self.rows) * self.columns + cell[0] % self.columns
+
+    def spawn(self):
+        return self.free.pop_random(self.rng)
+
+    def head(self):
+        return self.body[0]
+
+    def tail(self):
+        return list(islice(self.body, 1, None))
+
+    def on_horizontal(self):
+        return self.direction[1] == 0
+
+    def on_vertical(self):
+        return self.direction[0] == 0
+
+    def turn(self, action):
+        if action in (LEFT, RIGHT) and self.on_vertical():
+            self.direction = DIRECTIONS[action]
+        elif action in (UP, DOWN) and self.on_horizontal():
+            self.direction = DIRECTIONS[action]
+
+    def collides(self, cell):
+        i = self.index(cell)
+        return self.static[i] != 0 or self.occupied[i] != 0
+
+    def step(self, action=NOOP):
+        if not self.alive:
+            return DIED
+        self.turn(action)
+        self.ticks += 1
+
+        self.last_removed = tail = self.body.pop()
+        i = self.index(tail)
+        self.occupied[i] -= 1
+        if not self.occupied[i] and not self.static[i] and tail != self.food and tail != self.mistake:
+            self.free.add(tail)
+        x, y = self.body[0]
+        dx, dy = self.direction
+        head = ((x + dx) % self.columns, (y + dy) % self.rows)
+        dead = self.collides(head)
+        self.body.appendleft(head)
+        self.occupied[self.index(head)] += 1
+        self.free.discard(head)
+
+        if dead:
+            self.alive = False
+            return DIED
+
+        events = 0
+        if head == self.food:
+            self.score += 1
+            self.body.append(tail)
+            self.occupied[self.index(tail)] += 1
+            self.free.discard(tail)
+            self.food = self.spawn()
+            events |= ATE
+        if head == self.mistake:
+            events |= MISTAKE
+        return events
@@ -0,0 +1,85 @@
+OBSTACLE_CHARS = '#o'
+
+
+class FreeCells:
+
+    def __init__(self, cells=()):
+        self.cells = []
+        self.positions = {}
+        for cell in cells:
+            self.add(cell)
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __contains__(self, cell):
+        return cell in self.positions
+
+    def copy(self):
+        other = FreeCells()
+        other.cells = list(self.cells)
+        other.positions = dict(self.positions)
+        return other
+
+    @classmethod
+    def from_list(cls, cells):
+        # The order of `cells` is what the random draws depend on, so it is
+        # kept as given rather than rebuilt through add().
+        other = cls()
+        other.cells = list(cells)
+        other.positions = {cell: i for i, cell in enumerate(other.cells)}
+        return other
+
+    def add(self, cell):
+        if cell not in self.positions:
+            self.positions[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def discard(self, cell):
+        # Swap the last cell into the hole so removal stays O(1).
+        position = self.positions.pop(cell, None)
+        if position is None:
+            return
+        last = self.cells.pop()
+        if position < len(self.cells):
+            self.cells[position] = last
+            self.positions[last] = position
+
+    def choice(self, rng):
+        if not self.cells:
+            return None
+        return self.cells[rng.randrange(len(self.cells))]
+
+    def pop_random(self, rng):
+        cell = self.choice(rng)
+        if cell is not None:
+            self.discard(cell)
+        return cell
+
+
+class Level:
+
+    def __init__(self, obstacles=(), random_obstacles=0, columns=None, rows=None, name=None):
+        self.obstacles = set(obstacles)
+        self.random_obstacles = random_obstacles
+        self.columns = columns
+        self.rows = rows
+        self.name = name
+
+    def __contains__(self, cell):
+        return cell in self.obstacles
+
+    def fits(self, columns, rows):
+        return all(0 <= x < columns and 0 <= y < rows for x, y in self.obstacles)
+
+
+def parse_level(text, random_obstacles=0, name=None):
+    lines = [line.rstrip('\n') for line in text.splitlines() if line.strip()]
+    obstacles = [(x, y) for y, line in enumerate(lines) for x, char in enumerate(line) if char in OBSTACLE_CHARS]
+    columns = max((len(line) for line in lines), default=0)
+    return Level(obstacles, random_obstacles, columns, len(lines), name)
+
+
+def load_level(path, random_obstacles=0):
+    with open(path, encoding='utf-8') as f:
+        return parse_level(f.read(), random_obstacles, path)
@@ -1,14 +1,36 @@
+import argparse
+import os
 import pygame
-import random
 import sys
+import time
+from collections import OrderedDict
+from autopilot import Autopilot
+from engine import ATE, DIED, DOWN, LEFT, MISTAKE, RIGHT, UP, SnakeEngine, TurnBuffer
+from level import load_level
+from profiler import PERCENTILES, FrameProfiler
+from replay import REPLAY_SUFFIX, Recorder
 
 FRAMERATE = 10
+TICK_RATE = 10
+RENDER_RATE = 60
+MAX_FRAME_TIME = 0.25
 SEGMENT_WIDTH = 20
 SEGMENT_HEIGHT = 20
 SEGMENT_MARGIN = 5
 WALL_THICKNESS = 25
 BUTTON_PADX = 50
 BUTTON_PADY = 2
+SCORE_BOARD_HEIGHT = 100
+SEGMENT_SIZE = SEGMENT_WIDTH + SEGMENT_MARGIN
+CHUNK_CELLS = 8
+CHUNK_SIZE = CHUNK_CELLS * SEGMENT_SIZE
+CHUNK_CACHE = 128
+CAMERA_MARGIN = 0.3
+REPLAY_DIR = 'replays'
+PAUSE_SHADE = (0, 0, 0, 140)
+OVERLAY_FONT_SIZE = 14
+OVERLAY_INTERVAL = 0.5
+OVERLAY_PHASES = ('busy', 'events', 'engine', 'sprites', 'text', 'draw', 'display', 'overlay')
 
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -23,6 +45,20 @@ GREY = (211, 211, 211)
 
 DEFAULT_FONT = 'freesansbold.ttf'
 
+MENU = 'menu'
+PLAYING = 'playing'
+PAUSED = 'paused'
+GAME_OVER = 'game_over'
+
+TILES = {}
+
+KEY_ACTIONS = {
+    pygame.K_UP: UP,
+    pygame.K_DOWN: DOWN,
+    pygame.K_LEFT: LEFT,
+    pygame.K_RIGHT: RIGHT,
+}
+
 
 class Button:
     def __init__(self, screen, font, text, text_color, color, centerx, centery):
@@ -36,6 +72,7 @@ class Button:
         self.button_color = color
         self.color = color
         self.clicked = False
+        self.dirty = True
 
     def add_paddings(self, padx=0, pady=0):
         self.button_rect = self.button_text_pos.inflate(padx, pady)
@@ -44,9 +81,17 @@ class Button:
         pygame.draw.rect(self.screen, self.button_color, self.button_rect)
         self.screen.blit(self.button_text, self.button_text_pos)
         self.clicked = False
+        self.dirty = False
+        return self.button_rect
+
+    def redraw(self):
+        if self.dirty:
+            return self.draw()
+        return None
 
     def mouse_handler(self, mouse_pos, mouse_state, hover=False, hover_color=None, on_click=None):
         self.clicked = False
+        button_color = self.button_color
         if self.button_rect.collidepoint(mouse_pos):
             if hover:
                 self.button_color = hover_color
@@ -55,6 +100,8 @@ class Button:
                 on_click()
         else:
             self.button_color = self.color
+        if self.button_color != button_color:
+            self.dirty = True
 
 
 class ToggleButton(Button):
@@ -68,130 +115,102 @@ class ToggleButton(Button):
         self.toggle_text = state
         self.true_text = true_text
         self.true_color = true_color
+        self.true_button_text = self.font.render(self.true_text, True, self.text_color)
+        self.dirty = True
 
     def draw(self):
         if self.toggle_text:
             if self.status:
                 self.button_color = self.true_color
-                self.button_text = self.font.render(self.true_text, True, self.text_color)
-        super().draw()
+                self.button_text = self.true_button_text
+        return super().draw()
 
     def mouse_handler(self, *args, **kwargs):
         super().mouse_handler(*args, **kwargs)
         if self.clicked:
             self.status = not self.status
+            self.dirty = True
 
 
-class Snake(pygame.sprite.Group):
+def tile_surface(color, width=SEGMENT_WIDTH, height=SEGMENT_HEIGHT):
+    key = (color, width, height)
+    surface = TILES.get(key)
+    if surface is None:
+        surface = pygame.Surface([width, height])
+        surface.fill(color)
+        TILES[key] = surface
+    return surface
 
-    def __init__(self, start_x, start_y, length=2):
-        super().__init__()
-        self.start_x = start_x
-        self.start_y = start_y
-        self.length = length
-        self.snake_segments = []
-        self.segment_width = SEGMENT_WIDTH
-        self.segment_height = SEGMENT_HEIGHT
-        self.segment_margin = SEGMENT_MARGIN
-        self.last_removed = None
-
-        self.segment_size = self.segment_width + self.segment_margin
-
-        for i in range(self.length):
-            x = self.start_x - (self.segment_size) * i
-            y = self.start_y
-            self.add_segment(x, y)
-
-        self.x_vel = 1 * self.segment_size
-        self.y_vel = 0
-
-    def add_segment(self, x, y, index=None):
-        if index is None:
-            index = self.length
-        segment = SnakeSegment(x, y, self.segment_width, self.segment_height)
-        self.snake_segments.insert(index, segment)
-        self.add(segment)
-        self.length += 1
-
-    def pop(self):
-        last_segment = self.snake_segments.pop()
-        self.last_removed = last_segment
-        self.remove(last_segment)
-        self.length -= 1
-
-    def head(self):
-        return self.snake_segments[0]
-
-    def tail(self):
-        return self.snake_segments[1:]
-
-    def on_horizontal(self):
-        return self.y_vel == 0
-
-    def on_vertical(self):
-        return self.x_vel == 0
-
-    def go_left(self):
-        self.x_vel = -1 * (self.segment_size)
-        self.y_vel = 0
-
-    def go_right(self):
-        self.x_vel = 1 * (self.segment_size)
-        self.y_vel = 0
-
-    def go_up(self):
-        self.x_vel = 0
-        self.y_vel = -1 * (self.segment_size)
-
-    def go_down(self):
-        self.x_vel = 0
-        self.y_vel = 1 * (self.segment_size)
-
-    def move(self, bound):
-        self.pop()
-
-        x = self.head().x + self.x_vel
-        if x > bound['max_x']:
-            x = bound['min_x'] + SEGMENT_MARGIN
-        elif x < bound['min_x']:
-            x = bound['max_x'] + SEGMENT_MARGIN
-        y = self.head().y + self.y_vel
-        if y > bound['max_y']:
-            y = bound['min_y'] + SEGMENT_MARGIN
-        elif y < bound['min_y']:
-            y = bound['max_y'] + SEGMENT_MARGIN
-        self.add_segment(x, y, 0)
-
-    def collides(self, sprite1):
-        return self.head().check_collision(sprite1)
-
-    def collides_any(self, group):
-        for sprite in group:
-            if self.collides(sprite):
-                return True
-        return False
-
-    def grow(self):
-        self.add_segment(self.last_removed.rect.x, self.last_removed.rect.y)
-
-
-class SnakeSegment(pygame.sprite.Sprite):
-
-    def __init__(self, x, y, width, height):
-        super().__init__()
 
-        self.x = x
-        self.y = y
+class ProfilerOverlay:
 
-        self.image = pygame.Surface([width, height])
-        self.image.fill(DARK_GREEN)
+    def __init__(self, profiler, font, visible=False):
+        self.profiler = profiler
+        self.font = font
+        self.visible = visible
+        self.label_width = font.size('overlay ')[0]
+        self.column_width = font.size(' 999.99')[0]
+        line_height = font.get_linesize()
+        self.surface = pygame.Surface((self.label_width + self.column_width * 3 + 8,
+                                       line_height * (len(OVERLAY_PHASES) + 2) + 4))
+        self.rect = self.surface.get_rect()
+        self.refreshed = 0.0
+        self.frames = self.profiler.frames
+
+    def refresh(self):
+        # Text is rendered at most every OVERLAY_INTERVAL, so the overlay
+        # does not dominate the frames it is measuring.
+        now = time.perf_counter()
+        if now - self.refreshed < OVERLAY_INTERVAL:
+            return
+        fps = (self.profiler.frames - self.frames) / (now - self.refreshed) if self.refreshed else 0.0
+        self.refreshed = now
+        self.frames = self.profiler.frames
+
+        rows = [('fps {0:.1f}'.format(fps), ()), ('ms', ['p{0}'.format(q) for q in PERCENTILES])]
+        for phase in OVERLAY_PHASES:
+            rows.append((phase, ['{0:.2f}'.format(seconds * 1000) for seconds in self.profiler.percentiles(phase)]))
+        self.surface.fill(BLACK)
+        y = 2
+        for label, columns in rows:
+            self.surface.blit(self.font.render(label, True, GREEN), (4, y))
+            right = 4 + self.label_width
+            for text in columns:
+                right += self.column_width
+                rendered = self.font.render(text, True, GREEN)
+                self.surface.blit(rendered, (right - rendered.get_width(), y))
+            y += self.font.get_linesize()
 
-        self.rect = self.image.get_rect()
-        self.rect.x = self.x
-        self.rect.y = self.y
+    def draw(self, screen):
+        self.refresh()
+        return screen.blit(self.surface, self.rect)
+
+
+class ChunkCache:
+
+    def __init__(self, maxsize=CHUNK_CACHE):
+        self.maxsize = maxsize
+        self.items = OrderedDict()
+        self.spare = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def take_spare(self):
+        return self.spare.pop() if self.spare else None
+
+    def get(self, key):
+        if key in self.items:
+            self.items.move_to_end(key)
+            return self.items[key]
+        return None
 
-    def check_collision(self, sprite1):
-        return pygame.sprite.collide_rect(self, sprite1)
+    def put(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        # Evicted values are kept for reuse rather than dropped.
+        while len(self.items) > self.maxsize:
+            self.spare.append(self.items.popitem(last=False)[1])
 
 
 class Wall(pygame.sprite.Sprite):
@@ -212,82 +231,243 @@ class Wall(pygame.sprite.Sprite):
         self.rect.x = startpoint[0]
         self.rect.y = startpoint[1]
 
+    def set_color(self, color):
+        self.image.fill(color)
 
-class Food(pygame.sprite.Sprite):
 
-    def __init__(self, x_bound, y_bound):
-        super().__init__()
+class Tile(pygame.sprite.Sprite):
+    color = WHITE
 
-        self.image = pygame.Surface([SEGMENT_WIDTH, SEGMENT_HEIGHT])
-        self.image.fill(RED)
+    def __init__(self, x, y):
+        super().__init__()
 
+        self.image = tile_surface(self.color)
         self.rect = self.image.get_rect()
-        self.x_bound = x_bound
-        self.y_bound = y_bound
+        self.place(x, y)
 
-    def spawn(self):
-        segmentx_size = SEGMENT_WIDTH + SEGMENT_MARGIN
-        segmenty_size = SEGMENT_HEIGHT + SEGMENT_MARGIN
-        randx = random.randint(self.x_bound[0] // segmentx_size, self.x_bound[1] // segmentx_size - 1)
-        randy = random.randint(self.y_bound[0] // segmenty_size, self.y_bound[1] // segmenty_size - 1)
-        self.rect.x = (randx - 1) * segmentx_size + SEGMENT_MARGIN + WALL_THICKNESS
-        self.rect.y = (randy - 1) * segmenty_size + SEGMENT_MARGIN + WALL_THICKNESS
+    def set_color(self, color):
+        self.image = tile_surface(color)
 
-    def draw(self, screen):
-        screen.blit(self.image, self.rect)
+    def place(self, x, y):
+        self.rect.x = x
+        self.rect.y = y
 
+    def draw(self, screen, offset=(0, 0)):
+        screen.blit(self.image, self.rect.move(offset))
 
-class Mistake(pygame.sprite.Sprite):
 
-    def __init__(self, x_bound, y_bound):
-        super().__init__()
+class Food(Tile):
+    color = RED
 
-        self.image = pygame.Surface([SEGMENT_WIDTH, SEGMENT_HEIGHT])
-        self.image.fill(BLUE)
 
-        self.rect = self.image.get_rect()
-        self.x_bound = x_bound
-        self.y_bound = y_bound
+class Mistake(Tile):
+    color = BLUE
 
-    def spawn(self):
-        segmentx_size = SEGMENT_WIDTH + SEGMENT_MARGIN
-        segmenty_size = SEGMENT_HEIGHT + SEGMENT_MARGIN
-        randx = random.randint(self.x_bound[0] // segmentx_size, self.x_bound[1] // segmentx_size - 1)
-        randy = random.randint(self.y_bound[0] // segmenty_size, self.y_bound[1] // segmenty_size - 1)
-        self.rect.x = (randx - 1) * segmentx_size + SEGMENT_MARGIN + WALL_THICKNESS
-        self.rect.y = (randy - 1) * segmenty_size + SEGMENT_MARGIN + WALL_THICKNESS
 
-    def draw(self, screen):
-        screen.blit(self.image, self.rect)
+class Ob(Tile):
+    color = YELLOW
 
 
-class Ob(pygame.sprite.Sprite):
+class Scene:
+    rate = FRAMERATE
 
-    def __init__(self, x_bound, y_bound):
-        super().__init__()
+    def __init__(self, app):
+        self.app = app
+        self.buttons = []
 
-        self.image = pygame.Surface([SEGMENT_WIDTH, SEGMENT_HEIGHT])
-        self.image.fill(YELLOW)
+    def button(self, text, color, centerx, centery):
+        button = Button(self.app.screen, self.app.font, text, BLACK, color, centerx, centery)
+        button.add_paddings(BUTTON_PADX, BUTTON_PADY)
+        self.buttons.append(button)
+        return button
 
-        self.rect = self.image.get_rect()
-        self.x_bound = x_bound
-        self.y_bound = y_bound
+    def enter(self):
+        self.draw()
+
+    def draw(self):
+        pass
 
-    def spawn(self):
-        segmentx_size = SEGMENT_WIDTH + SEGMENT_MARGIN
-        segmenty_size = SEGMENT_HEIGHT + SEGMENT_MARGIN
-        randx = random.randint(self.x_bound[0] // segmentx_size, self.x_bound[1] // segmentx_size - 1)
-        randy = random.randint(self.y_bound[0] // segmenty_size, self.y_bound[1] // segmenty_size - 1)
-        self.rect.x = (randx - 1) * segmentx_size + SEGMENT_MARGIN + WALL_THICKNESS
-        self.rect.y = (randy - 1) * segmenty_size + SEGMENT_MARGIN + WALL_THICKNESS
+    def handle(self, event):
+        if event.type == pygame.VIDEOEXPOSE:
+            self.draw()
 
-    def draw(self, screen):
-        screen.blit(self.image, self.rect)
+    def update(self):
+        pass
+
+    def frame(self):
+        for event in self.app.poll():
+            self.handle(event)
+        self.update()
+        self.app.clock.tick(self.rate)
+
+
+class MenuScene(Scene):
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.title = app.font.render("Змейка", True, BLACK)
+        self.title_pos = self.title.get_rect()
+        self.title_pos.center = ((app.screen_width / 2), (app.screen_height / 4))
+        self.start_button = self.button("Начать игру", DARK_GREEN, self.title_pos.centerx,
+                                        self.title_pos.centery + 200)
+        self.quit_button = self.button("Покинуть игру", DARK_RED, self.title_pos.centerx,
+                                       self.title_pos.centery + 350)
+
+    def draw(self):
+        self.app.draw_menu(self.title, self.title_pos, self.buttons)
+
+    def update(self):
+        mouse_pos = pygame.mouse.get_pos()
+        mouse_click = [pygame.mouse.get_pressed()[0]]
+        self.start_button.mouse_handler(mouse_pos, mouse_click, True, GREEN, self.app.new_game)
+        self.quit_button.mouse_handler(mouse_pos, mouse_click, True, RED, self.app.quit)
+        self.app.update_buttons(self.buttons)
+
+
+class GameOverScene(Scene):
+
+    def __init__(self, app):
+        super().__init__(app)
+        centerx = app.screen_width / 2
+        centery = app.screen_height / 4
+        self.title = None
+        self.title_pos = None
+        self.try_again_button = self.button("Поробывать ещё раз", DARK_GREEN, centerx, centery + 150)
+        self.back_menu_button = self.button("На главное меню", DARK_BLUE, centerx, centery + 250)
+        self.quit_button = self.button("Покинуть игру", DARK_RED, centerx, centery + 350)
+
+    def enter(self):
+        self.title = self.app.font.render("Игра окончена! Счёт {}".format(self.app.score), True, BLACK)
+        self.title_pos = self.title.get_rect()
+        self.title_pos.center = ((self.app.screen_width / 2), (self.app.screen_height / 4))
+        self.draw()
+
+    def draw(self):
+        self.app.draw_menu(self.title, self.title_pos, self.buttons)
+
+    def update(self):
+        mouse_pos = pygame.mouse.get_pos()
+        mouse_click = [pygame.mouse.get_pressed()[0]]
+        self.try_again_button.mouse_handler(mouse_pos, mouse_click, True, GREEN, self.app.new_game)
+        self.back_menu_button.mouse_handler(mouse_pos, mouse_click, True, BLUE,
+                                            lambda: self.app.switch(MENU))
+        self.quit_button.mouse_handler(mouse_pos, mouse_click, True, RED, self.app.quit)
+        self.app.update_buttons(self.buttons)
+
+
+class PauseScene(Scene):
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.shade = pygame.Surface((app.screen_width, app.screen_height), pygame.SRCALPHA)
+        self.shade.fill(PAUSE_SHADE)
+        self.title = app.font.render("Пауза", True, WHITE)
+        self.title_pos = self.title.get_rect()
+        self.title_pos.center = ((app.screen_width / 2), (app.screen_height / 4))
+        self.resume_button = self.button("Продолжить", DARK_GREEN, self.title_pos.centerx,
+                                         self.title_pos.centery + 150)
+        self.back_menu_button = self.button("На главное меню", DARK_BLUE, self.title_pos.centerx,
+                                            self.title_pos.centery + 250)
+
+    def draw(self):
+        # The frozen board stays visible under the shade.
+        self.app.draw_board()
+        self.app.screen.blit(self.shade, (0, 0))
+        self.app.screen.blit(self.title, self.title_pos)
+        for button in self.buttons:
+            button.draw()
+        pygame.display.update()
+
+    def handle(self, event):
+        super().handle(event)
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            self.app.switch(PLAYING)
+
+    def update(self):
+        mouse_pos = pygame.mouse.get_pos()
+        mouse_click = [pygame.mouse.get_pressed()[0]]
+        self.resume_button.mouse_handler(mouse_pos, mouse_click, True, GREEN, lambda: self.app.switch(PLAYING))
+        self.back_menu_button.mouse_handler(mouse_pos, mouse_click, True, BLUE, lambda: self.app.switch(MENU))
+        self.app.update_buttons(self.buttons)
+
+
+class PlayScene(Scene):
+    rate = RENDER_RATE
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.tick = 1.0 / TICK_RATE
+        self.accumulator = 0.0
+        self.previous = 0.0
+
+    def enter(self):
+        # Entering (a new round or coming back from pause) restarts the clock,
+        # so the time spent elsewhere is not caught up in a burst of ticks.
+        self.accumulator = 0.0
+        self.previous = time.perf_counter()
+        self.app.redraw = True
+        self.app.render(1.0)
+
+    def handle(self, event):
+        app = self.app
+        if event.type == pygame.VIDEOEXPOSE:
+            app.redraw = True
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                app.switch(PAUSED)
+            if event.key == pygame.K_F2:
+                app.autopilot_enabled = not app.autopilot_enabled
+            if event.key == pygame.K_F3:
+                app.overlay.visible = not app.overlay.visible
+                app.redraw = True
+            if event.key in KEY_ACTIONS:
+                app.turns.push(KEY_ACTIONS[event.key], app.engine.direction)
+
+    def frame(self):
+        # The game advances in fixed ticks of 1 / TICK_RATE whatever the frame
+        # rate; frames in between only interpolate. Key presses are queued and
+        # applied one per tick, so two quick turns are no longer folded into
+        # one frame and lost.
+        app = self.app
+        app.profiler.begin()
+        now = time.perf_counter()
+        self.accumulator += min(now - self.previous, MAX_FRAME_TIME)
+        self.previous = now
+
+        for event in app.poll():
+            self.handle(event)
+        app.profiler.mark('events')
+        if app.next_scene is not None:
+            app.profiler.end()
+            return
+
+        ticks = 0
+        while self.accumulator >= self.tick:
+            self.accumulator -= self.tick
+            ticks += 1
+            if app.step() & DIED:
+                app.profiler.end(ticks=ticks, length=len(app.engine.body))
+                app.save_replay()
+                app.save_trace()
+                app.switch(GAME_OVER)
+                return
+
+        app.render(self.accumulator / self.tick)
+        app.clock.tick(self.rate)
+        app.profiler.mark('idle')
+        app.profiler.end(ticks=ticks, length=len(app.engine.body))
 
 
 class App:
 
-    def __init__(self, width=800, height=600):
+    def __init__(self, width=800, height=600, level=None, replay_dir=None, trace_path=None, profile=False,
+                 autopilot=False, columns=None, rows=None):
+        self.level = level
+        self.columns = columns
+        self.rows = rows
+        self.autopilot_enabled = autopilot
+        self.replay_dir = replay_dir
+        self.trace_path = trace_path
         pygame.mixer.init()
         pygame.init()
         pygame.font.init()
@@ -302,280 +482,392 @@ class App:
         self.toggle_font = pygame.font.Font(DEFAULT_FONT, 40)
 
         self.clock = pygame.time.Clock()
+        self.profiler = FrameProfiler(trace=trace_path is not None)
+        self.overlay = ProfilerOverlay(self.profiler, pygame.font.Font(DEFAULT_FONT, OVERLAY_FONT_SIZE), profile)
+        self.score_board = pygame.Surface((self.screen_width, SCORE_BOARD_HEIGHT))
+        self.score_board_rect = self.score_board.get_rect()
+        self.chunks = ChunkCache()
+        self.background_version = 0
+
+        # One instance per scene for the whole session: switching scenes only
+        # swaps which one the loop drives, and the buttons are built once.
+        self.scenes = {
+            MENU: MenuScene(self),
+            PLAYING: PlayScene(self),
+            PAUSED: PauseScene(self),
+            GAME_OVER: GameOverScene(self),
+        }
+        self.scene = None
+        self.next_scene = None
+        self.engine = None
+        self.board = None
 
-    def game_init(self):
+    def game_init(self, seed=None):
         self.score = 0
-        self.running = True
-
-        self.score_board = pygame.Surface((self.screen_width, 100))
-        self.score_text = self.font.render("Счёт: " + str(self.score), True, RED)
-        self.score_text_pos = self.score_text.get_rect()
-        self.score_text_pos.centerx = self.score_board.get_rect().centerx
-        self.score_text_pos.centery = self.score_board.get_rect().centery
+        self.render_score()
 
         self.game_bound = {
             'min_x': 0,
             'max_x': self.screen_width,
-            'min_y': 100,
+            'min_y': SCORE_BOARD_HEIGHT,
             'max_y': self.screen_height,
         }
+        self.viewport = pygame.Rect(self.game_bound['min_x'], self.game_bound['min_y'],
+                                    self.game_bound['max_x'] - self.game_bound['min_x'],
+                                    self.game_bound['max_y'] - self.game_bound['min_y'])
+
+        # The board defaults to what fits the window; a bigger one scrolls
+        # under a camera that follows the head. The engine is built once per
+        # board and only reset between rounds, which on a big board skips
+        # rebuilding the empty-board free-cell index every time.
+        board = (self.columns or self.viewport.width // SEGMENT_SIZE,
+                 self.rows or self.viewport.height // SEGMENT_SIZE, self.walls_toggle, self.level)
+        if self.engine is not None and board == self.board:
+            self.engine.reset(seed)
+        else:
+            self.engine = SnakeEngine(board[0], board[1], walls=self.walls_toggle, seed=seed, level=self.level)
+            self.board = board
+        self.board_width = self.engine.columns * SEGMENT_SIZE
+        self.board_height = self.engine.rows * SEGMENT_SIZE
+        self.camera = (0, 0)
+
+        self.food = Food(*self.cell_position(self.engine.food))
+        self.mistake = Mistake(*self.cell_position(self.engine.mistake))
+        self.obstacles = {}
+        for cell in self.engine.obstacles:
+            self.obstacles.setdefault(self.chunk_key(cell), []).append(Ob(*self.cell_position(cell)))
 
         if self.walls_toggle:
-            wall_color = YELLOW
-            wall_list = [
-                Wall(wall_color, (self.game_bound['min_x'], self.game_bound['min_y']),
-                     (self.game_bound['max_x'], self.game_bound['min_y']), WALL_THICKNESS),
-                Wall(wall_color, (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['min_y']),
-                     (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['max_y']), WALL_THICKNESS),
-                Wall(wall_color, (self.game_bound['min_x'], self.game_bound['max_y'] - WALL_THICKNESS),
-                     (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS),
-                     WALL_THICKNESS),
-                Wall(wall_color, (self.game_bound['min_x'], self.game_bound['min_y']),
-                     (self.game_bound['min_x'], self.game_bound['max_y']), WALL_THICKNESS)
-            ]
-            self.walls = pygame.sprite.Group()
-            self.walls.add(wall_list)
-
-        self.food = Food((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                         (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.food.spawn()
-
-        self.mistake = Mistake((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                               (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.mistake.spawn()
-
-        self.ob1 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob1.spawn()
-        self.ob2 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob2.spawn()
-        self.ob3 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob3.spawn()
-        self.ob4 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob4.spawn()
-        self.ob5 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob5.spawn()
-        self.ob6 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob6.spawn()
-        self.ob7 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob7.spawn()
-        self.ob8 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob8.spawn()
-        self.ob9 = Ob((self.game_bound['min_x'] + WALL_THICKNESS, self.game_bound['max_x'] - WALL_THICKNESS),
-                      (self.game_bound['min_y'] + WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS))
-        self.ob9.spawn()
-
-        self.snake = Snake(self.game_bound['min_x'] + WALL_THICKNESS + SEGMENT_MARGIN,
-                           self.game_bound['min_y'] + WALL_THICKNESS + SEGMENT_MARGIN)
+            self.walls = self.build_walls(YELLOW)
+        self.compose_background(YELLOW)
 
-    def run(self):
-        self.game_init()
-        while self.running:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.quit()
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_ESCAPE:
-                        self.on_pause()
-                    if self.snake.on_vertical():
-                        if event.key == pygame.K_LEFT:
-                            self.snake.go_left()
-                        elif event.key == pygame.K_RIGHT:
-                            self.snake.go_right()
-                    elif self.snake.on_horizontal():
-                        if event.key == pygame.K_UP:
-                            self.snake.go_up()
-                        elif event.key == pygame.K_DOWN:
-                            self.snake.go_down()
-
-            self.screen.fill(WHITE)
-            self.score_board.fill(GREY)
-
-            self.score_text = self.font.render("Счёт: " + str(self.score), True, RED)
-
-            self.snake.move(self.game_bound)
-            if self.walls_toggle:
-                self.walls.draw(self.screen)
+    def cell_position(self, cell):
+        # Sprites live in board coordinates; the camera offset is applied when
+        # they are drawn.
+        return (SEGMENT_MARGIN + cell[0] * SEGMENT_SIZE, SEGMENT_MARGIN + cell[1] * SEGMENT_SIZE)
 
-            self.food.draw(self.screen)
-            self.mistake.draw(self.screen)
-            self.ob1.draw(self.screen)
-            self.ob2.draw(self.screen)
-            self.ob3.draw(self.screen)
-            self.ob4.draw(self.screen)
-            self.ob5.draw(self.screen)
-            self.ob6.draw(self.screen)
-            self.ob7.draw(self.screen)
-            self.ob8.draw(self.screen)
-            self.ob9.draw(self.screen)
+    def offset(self):
+        return (self.viewport.x - self.camera[0], self.viewport.y - self.camera[1])
 
-            self.snake.draw(self.screen)
-            self.score_board.blit(self.score_text, self.score_text_pos)
+    def cell_rect(self, cell):
+        x, y = self.offset()
+        return pygame.Rect(x + SEGMENT_MARGIN + cell[0] * SEGMENT_SIZE, y + SEGMENT_MARGIN + cell[1] * SEGMENT_SIZE,
+                           SEGMENT_WIDTH, SEGMENT_HEIGHT)
 
-            pygame.draw.rect(self.screen, GREEN, self.snake.head().rect, 1)
+    def chunk_key(self, cell):
+        return (cell[0] // CHUNK_CELLS, cell[1] // CHUNK_CELLS)
 
+    def render_score(self):
+        self.score_text = self.font.render("Счёт: " + str(self.score), True, RED)
+        self.score_text_pos = self.score_text.get_rect()
+        self.score_text_pos.center = self.score_board_rect.center
+        self.score_board.fill(GREY)
+        self.score_board.blit(self.score_text, self.score_text_pos)
+
+    def compose_background(self, wall_color):
+        # Walls and obstacles never move, so they are pre-rendered into
+        # CHUNK_SIZE square surfaces on first sight. Recolouring the walls (or
+        # a new round) only bumps the version; stale chunks are repainted in
+        # place when next drawn, so no surface is allocated again.
+        if self.walls_toggle:
+            for wall in self.walls:
+                wall.set_color(wall_color)
+        self.background_version += 1
+
+    def chunk(self, key):
+        entry = self.chunks.get(key)
+        if entry is None:
+            entry = self.chunks.take_spare() or [pygame.Surface((CHUNK_SIZE, CHUNK_SIZE)), None]
+            entry[1] = None
+            self.chunks.put(key, entry)
+        surface, version = entry
+        if version != self.background_version:
+            surface.fill(WHITE)
+            offset = (-key[0] * CHUNK_SIZE, -key[1] * CHUNK_SIZE)
             if self.walls_toggle:
-                if self.snake.collides_any(self.walls) or self.snake.collides_any(
-                        self.snake.tail() or self.snake.collides(self.ob1)):
-                    self.running = False
-                    self.game_end()
-                elif self.snake.collides_any(self.snake.tail()):
-                    self.running = False
-                    self.game_end()
-                else:
-                    if self.snake.collides(self.ob1) or self.snake.collides(self.ob2) or self.snake.collides(self.ob2) \
-                            or self.snake.collides(self.ob3) or self.snake.collides(self.ob4) or self.snake.collides(
-                        self.ob5) \
-                            or self.snake.collides(self.ob6) or self.snake.collides(self.ob7) or self.snake.collides(
-                        self.ob8) \
-                            or self.snake.collides(self.ob9):
-                        self.running = False
-                        self.game_end()
-
-            if self.snake.collides(self.food):
-                self.food.image.fill(RED)
-                self.score += 1
-                self.snake.grow()
-                self.food.spawn()
-                if self.walls_toggle:
-                    wall_color = RED
-                    wall_list = [
-                        Wall(wall_color, (self.game_bound['min_x'], self.game_bound['min_y']),
-                             (self.game_bound['max_x'], self.game_bound['min_y']), WALL_THICKNESS),
-                        Wall(wall_color, (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['min_y']),
-                             (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['max_y']), WALL_THICKNESS),
-                        Wall(wall_color, (self.game_bound['min_x'], self.game_bound['max_y'] - WALL_THICKNESS),
-                             (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS),
-                             WALL_THICKNESS),
-                        Wall(wall_color, (self.game_bound['min_x'], self.game_bound['min_y']),
-                             (self.game_bound['min_x'], self.game_bound['max_y']), WALL_THICKNESS)
-                    ]
-                    self.walls = pygame.sprite.Group()
-                    self.walls.add(wall_list)
-
-            if self.snake.collides(self.mistake):
-                self.food.image.fill(BLUE)
-
-                if self.walls_toggle:
-                    wall_color = BLUE
-                    wall_list = [
-                        Wall(wall_color, (self.game_bound['min_x'], self.game_bound['min_y']),
-                             (self.game_bound['max_x'], self.game_bound['min_y']), WALL_THICKNESS),
-                        Wall(wall_color, (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['min_y']),
-                             (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['max_y']), WALL_THICKNESS),
-                        Wall(wall_color, (self.game_bound['min_x'], self.game_bound['max_y'] - WALL_THICKNESS),
-                             (self.game_bound['max_x'] - WALL_THICKNESS, self.game_bound['max_y'] - WALL_THICKNESS),
-                             WALL_THICKNESS),
-                        Wall(wall_color, (self.game_bound['min_x'], self.game_bound['min_y']),
-                             (self.game_bound['min_x'], self.game_bound['max_y']), WALL_THICKNESS)
-                    ]
-                    self.walls = pygame.sprite.Group()
-                    self.walls.add(wall_list)
-
-            self.screen.blit(self.score_board, (0, 0))
+                for wall in self.walls:
+                    surface.blit(wall.image, wall.rect.move(offset))
+            for obstacle in self.obstacles.get(key, ()):
+                obstacle.draw(surface, offset)
+            entry[1] = self.background_version
+        return surface
+
+    def restore(self, rect):
+        # Copies the static background under a screen rect from the chunks it
+        # overlaps; the whole viewport is at most a few dozen chunk blits.
+        x, y = self.offset()
+        area = rect.clip(self.viewport).move(-x, -y)
+        if not area.width or not area.height:
+            return
+        for cy in range(area.top // CHUNK_SIZE, (area.bottom - 1) // CHUNK_SIZE + 1):
+            for cx in range(area.left // CHUNK_SIZE, (area.right - 1) // CHUNK_SIZE + 1):
+                part = area.clip(pygame.Rect(cx * CHUNK_SIZE, cy * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE))
+                self.screen.blit(self.chunk((cx, cy)), part.move(x, y),
+                                 part.move(-cx * CHUNK_SIZE, -cy * CHUNK_SIZE))
+
+    def visible_cells(self):
+        x0 = self.camera[0] // SEGMENT_SIZE
+        y0 = self.camera[1] // SEGMENT_SIZE
+        x1 = min(self.engine.columns, (self.camera[0] + self.viewport.width) // SEGMENT_SIZE + 1)
+        y1 = min(self.engine.rows, (self.camera[1] + self.viewport.height) // SEGMENT_SIZE + 1)
+        return x0, y0, x1, y1
+
+    def follow(self, rect):
+        # Keeps the head CAMERA_MARGIN of the viewport away from its edges,
+        # clamped to the board; returns whether the camera moved.
+        x, y = self.camera
+        width, height = self.viewport.size
+        if self.board_width > width:
+            margin = int(width * CAMERA_MARGIN)
+            x = min(max(x, rect.right + margin - width), rect.left - margin)
+            x = max(0, min(x, self.board_width - width))
+        if self.board_height > height:
+            margin = int(height * CAMERA_MARGIN)
+            y = min(max(y, rect.bottom + margin - height), rect.top - margin)
+            y = max(0, min(y, self.board_height - height))
+        moved = (x, y) != self.camera
+        self.camera = (x, y)
+        return moved
+
+    def draw_board(self):
+        self.screen.set_clip(self.viewport)
+        self.restore(self.viewport)
+        offset = self.offset()
+        self.food.draw(self.screen, offset)
+        self.mistake.draw(self.screen, offset)
+
+        # Only segments inside the viewport are drawn: walk the body when it
+        # is shorter than the visible area, otherwise scan the visible cells.
+        image = tile_surface(DARK_GREEN)
+        x0, y0, x1, y1 = self.visible_cells()
+        occupied = self.engine.occupied
+        columns = self.engine.columns
+        if len(self.engine.body) <= (x1 - x0) * (y1 - y0):
+            for cell in self.engine.body:
+                if x0 <= cell[0] < x1 and y0 <= cell[1] < y1:
+                    self.screen.blit(image, self.cell_rect(cell))
+        else:
+            for y in range(y0, y1):
+                row = y * columns
+                for x in range(x0, x1):
+                    if occupied[row + x]:
+                        self.screen.blit(image, self.cell_rect((x, y)))
+        pygame.draw.rect(self.screen, GREEN, self.cell_rect(self.engine.head()), 1)
+        self.screen.set_clip(None)
+        self.screen.blit(self.score_board, (0, 0))
+
+    def draw_items(self, cell):
+        if cell == self.engine.food:
+            self.food.draw(self.screen, self.offset())
+        if cell == self.engine.mistake:
+            self.mistake.draw(self.screen, self.offset())
+
+    def moving_segments(self):
+        # The head slides from the previous head cell into the new one and the
+        # tail from the cell it just left; everything in between is already
+        # where it will be. A step that wraps around the board is not
+        # interpolated.
+        moving = []
+        body = self.engine.body
+        if len(body) > 1 and self.adjacent(body[1], body[0]):
+            moving.append((body[1], body[0], True))
+        removed = self.engine.last_removed
+        if removed is not None and removed != body[-1] and self.adjacent(removed, body[-1]):
+            moving.append((removed, body[-1], False))
+        return moving
+
+    def adjacent(self, a, b):
+        return abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1
+
+    def span_rect(self, a, b):
+        return self.cell_rect(a).union(self.cell_rect(b))
+
+    def slide(self, a, b, alpha):
+        start = self.cell_rect(a)
+        end = self.cell_rect(b)
+        return pygame.Rect(round(start.x + (end.x - start.x) * alpha),
+                           round(start.y + (end.y - start.y) * alpha), start.width, start.height)
+
+    def render(self, alpha):
+        motion = self.moving_segments()
+        head_rect = self.cell_rect(self.engine.head())
+        for a, b, head in motion:
+            if head:
+                head_rect = self.slide(a, b, alpha)
+        x, y = self.offset()
+        if self.follow(head_rect.move(-x, -y)):
+            self.redraw = True
+
+        full = self.redraw
+        if full:
+            self.redraw = False
+            self.changed.clear()
+            self.motion = []
+            self.draw_board()
+
+        # Restore what the ticks since the last frame touched and the spans the
+        # previous frame animated, then draw this frame's sliding segments.
+        self.screen.set_clip(self.viewport)
+        cells = self.changed
+        areas = [self.span_rect(a, b) for a, b, _ in self.motion]
+        for a, b, _ in self.motion:
+            cells.update((a, b))
+        self.motion = motion
+        for a, b, _ in self.motion:
+            cells.update((a, b))
+            areas.append(self.span_rect(a, b))
+        areas.extend(self.cell_rect(cell) for cell in cells)
+
+        for rect in areas:
+            self.restore(rect)
+        for cell in cells:
+            self.draw_items(cell)
+        image = tile_surface(DARK_GREEN)
+        sliding = {b for a, b, head in self.motion if head}
+        for cell in cells:
+            if self.engine.occupied[self.engine.index(cell)] and cell not in sliding:
+                self.screen.blit(image, self.cell_rect(cell))
+        head_rect = self.cell_rect(self.engine.head())
+        for a, b, head in self.motion:
+            rect = self.slide(a, b, alpha)
+            self.screen.blit(image, rect)
+            if head:
+                head_rect = rect
+        pygame.draw.rect(self.screen, GREEN, head_rect, 1)
+        self.screen.set_clip(None)
+        cells.clear()
+        areas = [rect.clip(self.viewport) for rect in areas]
+        self.profiler.mark('draw')
+
+        if self.overlay.visible:
+            areas.append(self.overlay.draw(self.screen))
+            self.profiler.mark('overlay')
+
+        if full:
             pygame.display.update()
-            self.clock.tick(FRAMERATE)
-
-    def main_menu(self):
-        self.intro_text = self.font.render("Змейка", True, BLACK)
-        self.intro_text_pos = self.intro_text.get_rect()
-        self.intro_text_pos.center = ((self.screen_width / 2), (self.screen_height / 4))
-
-        start_button = Button(
-            self.screen, self.font, "Начать игру",
-            BLACK, DARK_GREEN, self.intro_text_pos.centerx,
-            self.intro_text_pos.centery + 200
-        )
-        start_button.add_paddings(BUTTON_PADX, BUTTON_PADY)
-
-        quit_button = Button(
-            self.screen, self.font, "Покинуть игру",
-            BLACK, DARK_RED, self.intro_text_pos.centerx,
-            self.intro_text_pos.centery + 350
-        )
-        quit_button.add_paddings(BUTTON_PADX, BUTTON_PADY)
-
+        elif areas:
+            pygame.display.update(areas)
+        self.profiler.mark('display')
+
+    def build_walls(self, wall_color):
+        # In board coordinates along the border cells; chunks blit the part
+        # of each wall they overlap.
+        width = self.board_width
+        height = self.board_height
+        wall_list = [
+            Wall(wall_color, (0, 0), (width, 0), WALL_THICKNESS),
+            Wall(wall_color, (width - WALL_THICKNESS, 0), (width - WALL_THICKNESS, height), WALL_THICKNESS),
+            Wall(wall_color, (0, height - WALL_THICKNESS), (width - WALL_THICKNESS, height - WALL_THICKNESS),
+                 WALL_THICKNESS),
+            Wall(wall_color, (0, 0), (0, height), WALL_THICKNESS)
+        ]
+        walls = pygame.sprite.Group()
+        walls.add(wall_list)
+        return walls
+
+    def save_replay(self):
+        if self.replay_dir is None:
+            return None
+        os.makedirs(self.replay_dir, exist_ok=True)
+        name = '{0}-{1}{2}'.format(time.strftime('%Y%m%d-%H%M%S'), self.engine.seed, REPLAY_SUFFIX)
+        path = os.path.join(self.replay_dir, name)
+        self.recorder.save(path)
+        return path
+
+    def save_trace(self):
+        if self.trace_path is not None:
+            self.profiler.save(self.trace_path)
+
+    def step(self):
+        previous_food = self.engine.food
+        action = self.turns.pop()
+        if self.autopilot_enabled:
+            action = self.autopilot.action()
+        events = self.engine.step(action)
+        self.recorder.record()
+        self.profiler.mark('engine')
+
+        if events & ATE and self.engine.food is not None:
+            self.food.place(*self.cell_position(self.engine.food))
+        self.profiler.mark('sprites')
+
+        if events & ATE:
+            self.food.set_color(RED)
+            self.compose_background(RED)
+            self.redraw = True
+
+        if events & MISTAKE:
+            self.food.set_color(BLUE)
+            self.compose_background(BLUE)
+            self.redraw = True
+        self.profiler.mark('draw')
+
+        if self.engine.score != self.score:
+            self.score = self.engine.score
+            self.render_score()
+            self.redraw = True
+            self.profiler.mark('text')
+
+        # The vacated tail, the old head (loses its outline) and a respawned
+        # food cell; the new head is drawn by render.
+        if self.engine.last_removed is not None:
+            self.changed.add(self.engine.last_removed)
+        if len(self.engine.body) > 1:
+            self.changed.add(self.engine.body[1])
+        if self.engine.food not in (previous_food, None):
+            self.changed.add(self.engine.food)
+        self.changed.add(self.engine.head())
+        return events
+
+    def new_game(self, seed=None):
+        self.game_init(seed)
+        self.recorder = Recorder(self.engine)
+        self.turns = TurnBuffer()
+        self.autopilot = Autopilot(self.engine)
+        self.changed = set()
+        self.motion = []
+        self.redraw = True
+        self.switch(PLAYING)
+
+    def switch(self, name):
+        self.next_scene = name
+
+    def poll(self):
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
+                self.quit()
+        return events
+
+    def loop(self):
+        # A single flat loop: scenes never call each other, they only ask for
+        # a switch that takes effect before the next frame.
         while True:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.quit()
-
-            self.screen.fill(WHITE)
-
+            if self.next_scene is not None:
+                self.scene = self.scenes[self.next_scene]
+                self.next_scene = None
+                self.scene.enter()
+            self.scene.frame()
 
-            mouse_pos = pygame.mouse.get_pos()
-            mouse_click = pygame.mouse.get_pressed()
-
-            start_button.mouse_handler(mouse_pos, [mouse_click[0]], True, GREEN, self.run)
-            quit_button.mouse_handler(mouse_pos, [mouse_click[0]], True, RED, self.quit)
-
-            def walls_switch():
-                self.walls_toggle = not self.walls_toggle
-
-            self.screen.blit(self.intro_text, self.intro_text_pos)
+    def run(self):
+        self.new_game()
+        self.loop()
 
-            start_button.draw()
-            quit_button.draw()
+    def main_menu(self):
+        self.switch(MENU)
+        self.loop()
 
-            pygame.display.update()
-            self.clock.tick(FRAMERATE)
-
-    def game_end(self):
-        self.endgame_text = self.font.render("Игра окончена! Счёт {}".format(self.score), True, BLACK)
-        self.endgame_text_pos = self.endgame_text.get_rect()
-        self.endgame_text_pos.center = ((self.screen_width / 2), (self.screen_height / 4))
-
-        try_again_button = Button(
-            self.screen, self.font, "Поробывать ещё раз",
-            BLACK, DARK_GREEN, self.endgame_text_pos.centerx,
-            self.endgame_text_pos.centery + 150
-        )
-        try_again_button.add_paddings(BUTTON_PADX, BUTTON_PADY)
-
-        quit_button = Button(
-            self.screen, self.font, "Покинуть игру",
-            BLACK, DARK_RED, self.endgame_text_pos.centerx,
-            self.endgame_text_pos.centery + 350
-        )
-        quit_button.add_paddings(BUTTON_PADX, BUTTON_PADY)
-
-        back_menu_button = Button(
-            self.screen, self.font, "На главное меню",
-            BLACK, DARK_BLUE, self.endgame_text_pos.centerx,
-            self.endgame_text_pos.centery + 250
-        )
-        back_menu_button.add_paddings(BUTTON_PADX, BUTTON_PADY)
-
-        end = True
-        while end:
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    self.quit()
-
-            self.screen.fill(WHITE)
-
-            mouse_pos = pygame.mouse.get_pos()
-            mouse_click = pygame.mouse.get_pressed()
-
-            try_again_button.mouse_handler(mouse_pos, [mouse_click[0]], True, GREEN, self.run)
-            back_menu_button.mouse_handler(mouse_pos, [mouse_click[0]], True, BLUE, self.main_menu)
-            quit_button.mouse_handler(mouse_pos, [mouse_click[0]], True, RED, self.quit)
-
-            self.screen.blit(self.endgame_text, self.endgame_text_pos)
-
-            try_again_button.draw()
-            back_menu_button.draw()
-            quit_button.draw()
+    def draw_menu(self, title, title_pos, buttons):
+        self.screen.fill(WHITE)
+        self.screen.blit(title, title_pos)
+        for button in buttons:
+            button.draw()
+        pygame.display.update()
 
-            pygame.display.update()
-            self.clock.tick(FRAMERATE)
+    def update_buttons(self, buttons):
+        dirty = [rect for rect in (button.redraw() for button in buttons) if rect]
+        if dirty:
+            pygame.display.update(dirty)
 
     def quit(self):
         pygame.quit()
@@ -583,5 +875,18 @@ class App:
 
 
 if __name__ == "__main__":
-    snake_app = App()
+    parser = argparse.ArgumentParser(description='Play Snake.')
+    parser.add_argument('level', nargs='?', default=None, help='level layout file')
+    parser.add_argument('--profile', action='store_true', help='show the frame-time overlay (toggle with F3)')
+    parser.add_argument('--columns', type=int, default=None, help='board width in cells (default: fit the window)')
+    parser.add_argument('--rows', type=int, default=None, help='board height in cells (default: fit the window)')
+    parser.add_argument('--autopilot', action='store_true', help='let the autopilot steer (toggle with F2)')
+    parser.add_argument('--trace', default=None, help='write per-frame timings to this .csv or .json file')
+    parser.add_argument('--record', nargs='?', const=REPLAY_DIR, default=None, metavar='DIR',
+                        help='save a replay of every round to DIR (default: {0})'.format(REPLAY_DIR))
+    args = parser.parse_args()
+
+    snake_app = App(level=load_level(args.level) if args.level else None, trace_path=args.trace,
+                    replay_dir=args.record, profile=args.profile, autopilot=args.autopilot,
+                    columns=args.columns, rows=args.rows)
     snake_app.main_menu()
@@ -0,0 +1,116 @@
+import csv
+import json
+import math
+import time
+from collections import deque
+
+PHASES = ('events', 'engine', 'sprites', 'text', 'draw', 'display', 'overlay', 'idle')
+WINDOW = 600
+MIN_SECONDS = 1e-6
+BUCKETS_PER_OCTAVE = 8
+BUCKETS = BUCKETS_PER_OCTAVE * 21 + 1
+PERCENTILES = (50, 95, 99)
+
+
+def bucket(seconds):
+    if seconds <= MIN_SECONDS:
+        return 0
+    return min(BUCKETS - 1, int(math.log2(seconds / MIN_SECONDS) * BUCKETS_PER_OCTAVE) + 1)
+
+
+def bucket_limit(index):
+    return MIN_SECONDS * 2 ** (index / BUCKETS_PER_OCTAVE)
+
+
+class RollingHistogram:
+
+    def __init__(self, window=WINDOW):
+        # Log-spaced buckets (about 9% wide) over the last `window` samples:
+        # adding a sample and evicting the oldest are both O(1), and a
+        # percentile is one pass over a fixed number of buckets.
+        self.window = window
+        self.counts = [0] * BUCKETS
+        self.samples = deque()
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, seconds):
+        index = bucket(seconds)
+        self.samples.append(index)
+        self.counts[index] += 1
+        if len(self.samples) > self.window:
+            self.counts[self.samples.popleft()] -= 1
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        rank = max(1, math.ceil(q / 100 * len(self.samples)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return bucket_limit(index)
+        return bucket_limit(BUCKETS - 1)
+
+
+class FrameProfiler:
+
+    def __init__(self, phases=PHASES, window=WINDOW, trace=False):
+        self.phases = tuple(phases)
+        self.histograms = {phase: RollingHistogram(window) for phase in self.phases + ('busy',)}
+        self.trace = [] if trace else None
+        self.frames = 0
+        self.current = None
+        self.last = 0.0
+
+    def begin(self):
+        self.current = dict.fromkeys(self.phases, 0.0)
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        # Charges the time since the previous mark to `phase`; a phase marked
+        # several times in one frame (one per tick) accumulates.
+        if self.current is None:
+            return
+        now = time.perf_counter()
+        self.current[phase] += now - self.last
+        self.last = now
+
+    def end(self, **fields):
+        frame = self.current
+        if frame is None:
+            return None
+        self.current = None
+        frame['busy'] = sum(seconds for phase, seconds in frame.items() if phase != 'idle')
+        for phase, seconds in frame.items():
+            self.histograms[phase].add(seconds)
+        if self.trace is not None:
+            row = {'frame': self.frames}
+            row.update(frame)
+            row.update(fields)
+            self.trace.append(row)
+        self.frames += 1
+        return frame
+
+    def percentiles(self, phase, percentiles=PERCENTILES):
+        histogram = self.histograms[phase]
+        return [histogram.percentile(q) for q in percentiles]
+
+    def summary(self, percentiles=PERCENTILES):
+        return {phase: dict(zip(('p{0}'.format(q) for q in percentiles), self.percentiles(phase, percentiles)))
+                for phase in self.histograms}
+
+    def save(self, path):
+        rows = self.trace or []
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'summary': self.summary(), 'frames': rows}, f, indent=2)
+            return
+        fields = ['frame'] + list(self.phases) + ['busy']
+        for row in rows:
+            fields.extend(key for key in row if key not in fields)
+        with open(path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(rows)
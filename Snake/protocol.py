@@ -0,0 +1,158 @@
+import json
+import struct
+from collections import deque
+from engine import DIRECTIONS
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+WELCOME = 1
+SNAPSHOT = 2
+DELTA = 3
+TURN = 4
+
+FRAME = struct.Struct('<I')
+DELTA_HEADER = struct.Struct('<BI6H')
+MOVE = struct.Struct('<HB')
+CELL = struct.Struct('<HH')
+ID = struct.Struct('<H')
+SPAWN = struct.Struct('<HH')
+SCORE = struct.Struct('<HI')
+
+# Player ids travel as uint16.
+MAX_PLAYER = 0xFFFF
+
+# A move only carries the direction (actions 1-4 as 0-3) and whether the
+# tail dropped: the client already knows where the head was.
+TAIL_DROPPED = 4
+
+
+def frame(payload):
+    return FRAME.pack(len(payload)) + payload
+
+
+async def read_frame(reader):
+    size, = FRAME.unpack(await reader.readexactly(FRAME.size))
+    return await reader.readexactly(size)
+
+
+def encode_json(kind, message):
+    return bytes((kind,)) + json.dumps(message, separators=(',', ':')).encode('utf-8')
+
+
+def decode_json(payload):
+    return json.loads(payload[1:].decode('utf-8'))
+
+
+def encode_turn(action):
+    return bytes((TURN, action))
+
+
+def encode_delta(delta):
+    parts = [DELTA_HEADER.pack(DELTA, delta['tick'], len(delta['moves']), len(delta['deaths']),
+                               len(delta['spawns']), len(delta['food_removed']), len(delta['food_added']),
+                               len(delta['scores']))]
+    parts.extend(MOVE.pack(player, (action - 1) | (TAIL_DROPPED if dropped else 0))
+                 for player, action, dropped in delta['moves'])
+    parts.extend(ID.pack(player) for player in delta['deaths'])
+    for player, cells in delta['spawns']:
+        parts.append(SPAWN.pack(player, len(cells)))
+        parts.extend(CELL.pack(*cell) for cell in cells)
+    parts.extend(CELL.pack(*cell) for cell in delta['food_removed'])
+    parts.extend(CELL.pack(*cell) for cell in delta['food_added'])
+    parts.extend(SCORE.pack(player, score) for player, score in delta['scores'])
+    return b''.join(parts)
+
+
+def decode_delta(payload):
+    _, tick, moves, deaths, spawns, removed, added, scores = DELTA_HEADER.unpack_from(payload)
+    offset = DELTA_HEADER.size
+    delta = {'tick': tick, 'moves': [], 'deaths': [], 'spawns': [], 'food_removed': [], 'food_added': [],
+             'scores': []}
+    for _ in range(moves):
+        player, code = MOVE.unpack_from(payload, offset)
+        offset += MOVE.size
+        delta['moves'].append((player, (code & 3) + 1, bool(code & TAIL_DROPPED)))
+    for _ in range(deaths):
+        delta['deaths'].append(ID.unpack_from(payload, offset)[0])
+        offset += ID.size
+    for _ in range(spawns):
+        player, length = SPAWN.unpack_from(payload, offset)
+        offset += SPAWN.size
+        cells = [CELL.unpack_from(payload, offset + i * CELL.size) for i in range(length)]
+        offset += length * CELL.size
+        delta['spawns'].append((player, cells))
+    for key, count in (('food_removed', removed), ('food_added', added)):
+        for _ in range(count):
+            delta[key].append(CELL.unpack_from(payload, offset))
+            offset += CELL.size
+    for _ in range(scores):
+        delta['scores'].append(SCORE.unpack_from(payload, offset))
+        offset += SCORE.size
+    return delta
+
+
+class ClientState:
+
+    def __init__(self, welcome):
+        self.player = welcome['player']
+        self.columns = welcome['columns']
+        self.rows = welcome['rows']
+        self.walls = welcome['walls']
+        self.obstacles = [tuple(cell) for cell in welcome['obstacles']]
+        self.tick_rate = welcome['tick_rate']
+        self.tick = 0
+        self.snakes = {}
+        self.scores = {}
+        self.food = set()
+        self.occupied = bytearray(self.columns * self.rows)
+
+    def index(self, cell):
+        return cell[1] * self.columns + cell[0]
+
+    def head(self, player=None):
+        body = self.snakes.get(self.player if player is None else player)
+        return body[0] if body else None
+
+    def add_snake(self, player, cells):
+        body = deque(tuple(cell) for cell in cells)
+        self.snakes[player] = body
+        self.scores[player] = 0
+        for cell in body:
+            self.occupied[self.index(cell)] += 1
+
+    def remove_snake(self, player):
+        for cell in self.snakes.pop(player, ()):
+            self.occupied[self.index(cell)] -= 1
+        self.scores.pop(player, None)
+
+    def apply_snapshot(self, snapshot):
+        self.tick = snapshot['tick']
+        self.snakes.clear()
+        self.scores.clear()
+        self.occupied = bytearray(self.columns * self.rows)
+        for player, cells in snapshot['snakes'].items():
+            self.add_snake(int(player), cells)
+        self.scores.update((int(player), score) for player, score in snapshot['scores'].items())
+        self.food = {tuple(cell) for cell in snapshot['food']}
+
+    def apply_delta(self, delta):
+        if delta['tick'] <= self.tick:
+            return
+        self.tick = delta['tick']
+        for player, action, dropped in delta['moves']:
+            body = self.snakes[player]
+            x, y = body[0]
+            dx, dy = DIRECTIONS[action]
+            head = ((x + dx) % self.columns, (y + dy) % self.rows)
+            body.appendleft(head)
+            self.occupied[self.index(head)] += 1
+            if dropped:
+                self.occupied[self.index(body.pop())] -= 1
+        for player in delta['deaths']:
+            self.remove_snake(player)
+        self.food.difference_update(delta['food_removed'])
+        self.food.update(delta['food_added'])
+        for player, cells in delta['spawns']:
+            self.add_snake(player, cells)
+        self.scores.update(delta['scores'])
@@ -0,0 +1,148 @@
+import argparse
+import json
+import struct
+import time
+import zlib
+from engine import DIRECTIONS, DIRECTION_ACTIONS, NOOP, SnakeEngine
+from level import Level
+
+MAGIC = b'SNKR'
+VERSION = 2
+HEADER = struct.Struct('<4sHI')
+SNAPSHOT_INTERVAL = 1000
+SNAPSHOT_CELLS = 100
+REPLAY_SUFFIX = '.snkr'
+
+
+def engine_config(engine):
+    return {
+        'columns': engine.columns,
+        'rows': engine.rows,
+        'walls': engine.walls,
+        'start_length': engine.start_length,
+        'obstacles': sorted(engine.level.obstacles),
+        'random_obstacles': engine.level.random_obstacles,
+        'seed': engine.seed,
+    }
+
+
+def engine_from_config(config):
+    level = Level([tuple(cell) for cell in config['obstacles']], config['random_obstacles'])
+    return SnakeEngine(config['columns'], config['rows'], config['walls'],
+                       start_length=config['start_length'], seed=config['seed'], level=level)
+
+
+def pack(actions):
+    # Two 4-bit actions per byte, then zlib: a tick where nothing was pressed
+    # is a zero nibble, so long straight runs compress to almost nothing.
+    packed = bytearray((len(actions) + 1) // 2)
+    for i, action in enumerate(actions):
+        packed[i >> 1] |= action << ((i & 1) * 4)
+    return zlib.compress(bytes(packed), 9)
+
+
+def unpack(data, ticks):
+    packed = zlib.decompress(data)
+    return bytearray((packed[i >> 1] >> ((i & 1) * 4)) & 0xF for i in range(ticks))
+
+
+class Replay:
+
+    def __init__(self, config, actions=None):
+        self.config = config
+        self.actions = bytearray() if actions is None else actions
+
+    def __len__(self):
+        return len(self.actions)
+
+    def save(self, path):
+        config = json.dumps(dict(self.config, ticks=len(self.actions))).encode('utf-8')
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(config)))
+            f.write(config)
+            f.write(pack(self.actions))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            magic, version, size = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('{0} is not a version {1} snake replay'.format(path, VERSION))
+            config = json.loads(f.read(size).decode('utf-8'))
+            actions = unpack(f.read(), config.pop('ticks'))
+        return cls(config, actions)
+
+
+class Recorder:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.replay = Replay(engine_config(engine))
+        self.direction = engine.direction
+
+    def record(self):
+        # Called after every engine step. The log stores the direction the
+        # snake took on that tick whenever it changed, which also captures
+        # several key presses folded into one frame.
+        direction = self.engine.direction
+        self.replay.actions.append(NOOP if direction == self.direction else DIRECTION_ACTIONS[direction])
+        self.direction = direction
+
+    def save(self, path):
+        self.replay.save(path)
+
+
+class ReplayPlayer:
+
+    def __init__(self, replay, snapshot_interval=None):
+        self.replay = replay
+        self.engine = engine_from_config(replay.config)
+        # A snapshot costs memory in proportion to the board, so big boards
+        # take them less often (one per SNAPSHOT_CELLS cells of board).
+        if snapshot_interval is None:
+            snapshot_interval = max(SNAPSHOT_INTERVAL, self.engine.columns * self.engine.rows // SNAPSHOT_CELLS)
+        self.snapshot_interval = snapshot_interval
+        self.tick = 0
+        self.snapshots = {0: self.engine.get_state()}
+
+    def step(self):
+        action = self.replay.actions[self.tick]
+        if action != NOOP:
+            self.engine.direction = DIRECTIONS[action]
+        events = self.engine.step()
+        self.tick += 1
+        if self.tick % self.snapshot_interval == 0 and self.tick not in self.snapshots:
+            self.snapshots[self.tick] = self.engine.get_state()
+        return events
+
+    def seek(self, tick):
+        tick = max(0, min(tick, len(self.replay)))
+        start = max(t for t in self.snapshots if t <= tick)
+        if not start <= self.tick <= tick:
+            self.engine.set_state(self.snapshots[start])
+            self.tick = start
+        while self.tick < tick:
+            self.step()
+        return self.engine
+
+    def run(self):
+        return self.seek(len(self.replay))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Re-simulate a recorded snake game at full speed.')
+    parser.add_argument('path')
+    parser.add_argument('--seek', type=int, default=None, help='stop at this tick instead of the end')
+    args = parser.parse_args(argv)
+
+    replay = Replay.load(args.path)
+    player = ReplayPlayer(replay)
+    start = time.perf_counter()
+    engine = player.run() if args.seek is None else player.seek(args.seek)
+    elapsed = time.perf_counter() - start
+    print('tick {0}/{1}, score {2}, alive {3}, {4:.3f} s'.format(
+        player.tick, len(replay), engine.score, engine.alive, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,481 @@
+import argparse
+import asyncio
+import heapq
+import json
+import random
+import sys
+import time
+from collections import deque
+from engine import DIRECTIONS, DIRECTION_ACTIONS, NOOP, TurnBuffer
+from level import FreeCells
+from profiler import RollingHistogram
+from protocol import (DELTA, HOST, MAX_PLAYER, PORT, SNAPSHOT, TURN, WELCOME, ClientState, decode_delta,
+                      decode_json, encode_delta, encode_json, encode_turn, frame, read_frame)
+
+COLUMNS = 200
+ROWS = 200
+OBSTACLES = 200
+FOOD = 100
+START_LENGTH = 3
+TICK_RATE = 10
+RESPAWN_TICKS = 10
+SPAWN_ATTEMPTS = 20
+MAX_BUFFER = 1 << 20
+BACKLOG = 1024
+WINDOW = 1000
+LOAD_CLIENTS = 200
+LOAD_TICKS = 300
+BOT_TURN_CHANCE = 0.1
+
+
+class Player:
+
+    def __init__(self, body, direction):
+        self.body = deque(body)
+        self.direction = direction
+        self.turns = TurnBuffer()
+        self.grow = 0
+        self.score = 0
+
+
+class World:
+
+    def __init__(self, columns=COLUMNS, rows=ROWS, walls=True, obstacles=OBSTACLES, food=FOOD,
+                 start_length=START_LENGTH, respawn_ticks=RESPAWN_TICKS, seed=None):
+        self.columns = columns
+        self.rows = rows
+        self.walls = walls
+        self.food_count = food
+        self.start_length = start_length
+        self.respawn_ticks = respawn_ticks
+        self.rng = random.Random(seed)
+        self.tick = 0
+
+        # The same layout as SnakeEngine: walls and obstacles in `static`,
+        # a per-cell body count shared by every snake, and a free-cell index
+        # that spawning (snakes and food) draws from.
+        self.static = bytearray(columns * rows)
+        self.occupied = bytearray(columns * rows)
+        self.free = FreeCells((x, y) for y in range(rows) for x in range(columns))
+        if walls:
+            for x in range(columns):
+                self.block((x, 0))
+                self.block((x, rows - 1))
+            for y in range(rows):
+                self.block((0, y))
+                self.block((columns - 1, y))
+        self.obstacles = []
+        for _ in range(obstacles):
+            cell = self.free.pop_random(self.rng)
+            if cell is None:
+                break
+            self.block(cell)
+            self.obstacles.append(cell)
+
+        self.players = {}
+        self.waiting = {}
+        self.left = []
+        self.next_player = 1
+        self.free_ids = []
+        self.food = set()
+        self.place_food()
+
+    def index(self, cell):
+        return cell[1] * self.columns + cell[0]
+
+    def block(self, cell):
+        self.static[self.index(cell)] = 1
+        self.free.discard(cell)
+
+    def release(self, cell):
+        i = self.index(cell)
+        self.occupied[i] -= 1
+        if not self.occupied[i] and not self.static[i] and cell not in self.food:
+            self.free.add(cell)
+
+    def occupy(self, cell):
+        self.occupied[self.index(cell)] += 1
+        self.free.discard(cell)
+
+    def join(self):
+        # Ids go out on the wire as uint16, so the ones players leave behind
+        # are handed out again; None when all of them are taken.
+        if self.free_ids:
+            player = heapq.heappop(self.free_ids)
+        elif self.next_player <= MAX_PLAYER:
+            player = self.next_player
+            self.next_player += 1
+        else:
+            return None
+        self.waiting[player] = 0
+        return player
+
+    def leave(self, player):
+        # A snake on the board is removed (and its id freed) on the next tick;
+        # a player still waiting to spawn frees the id at once.
+        if player in self.waiting:
+            del self.waiting[player]
+            heapq.heappush(self.free_ids, player)
+        elif player in self.players and player not in self.left:
+            self.left.append(player)
+
+    def turn(self, player, action):
+        snake = self.players.get(player)
+        if snake is not None and action in DIRECTIONS:
+            snake.turns.push(action, snake.direction)
+
+    def spawn(self):
+        # A random free head with the body trailing straight behind it, all
+        # on free cells, facing a free cell.
+        for _ in range(SPAWN_ATTEMPTS):
+            head = self.free.choice(self.rng)
+            if head is None:
+                return None
+            action = self.rng.choice(list(DIRECTIONS))
+            dx, dy = DIRECTIONS[action]
+            cells = [((head[0] - k * dx) % self.columns, (head[1] - k * dy) % self.rows)
+                     for k in range(-1, self.start_length)]
+            if all(cell in self.free for cell in cells):
+                return Player(cells[1:], (dx, dy))
+        return None
+
+    def place_food(self):
+        added = []
+        while len(self.food) < self.food_count:
+            cell = self.free.pop_random(self.rng)
+            if cell is None:
+                break
+            self.food.add(cell)
+            added.append(cell)
+        return added
+
+    def step(self):
+        self.tick += 1
+        delta = {'tick': self.tick, 'moves': [], 'deaths': [], 'spawns': [], 'food_removed': [],
+                 'food_added': [], 'scores': []}
+
+        for player in self.left:
+            snake = self.players.pop(player, None)
+            if snake is not None:
+                for cell in snake.body:
+                    self.release(cell)
+                delta['deaths'].append(player)
+                heapq.heappush(self.free_ids, player)
+        self.left = []
+
+        # Every snake moves at once: tails first, so a head may take the cell
+        # a tail (its own or another's) leaves on the same tick; two heads on
+        # one cell kill both.
+        dropped = {}
+        heads = {}
+        for player, snake in self.players.items():
+            action = snake.turns.pop()
+            if action != NOOP:
+                snake.direction = DIRECTIONS[action]
+            if snake.grow:
+                snake.grow -= 1
+                dropped[player] = False
+            else:
+                self.release(snake.body.pop())
+                dropped[player] = True
+            x, y = snake.body[0]
+            dx, dy = snake.direction
+            head = ((x + dx) % self.columns, (y + dy) % self.rows)
+            heads[head] = heads.get(head, 0) + 1
+
+        dead = []
+        for player, snake in self.players.items():
+            x, y = snake.body[0]
+            dx, dy = snake.direction
+            head = ((x + dx) % self.columns, (y + dy) % self.rows)
+            i = self.index(head)
+            if self.static[i] or self.occupied[i] or heads[head] > 1:
+                dead.append(player)
+                continue
+            snake.body.appendleft(head)
+            delta['moves'].append((player, DIRECTION_ACTIONS[snake.direction], dropped[player]))
+        for player, snake in self.players.items():
+            if player not in dead:
+                self.occupy(snake.body[0])
+
+        for player in dead:
+            snake = self.players.pop(player)
+            for cell in snake.body:
+                self.release(cell)
+            delta['deaths'].append(player)
+            self.waiting[player] = self.respawn_ticks
+
+        for player, snake in self.players.items():
+            head = snake.body[0]
+            if head in self.food:
+                self.food.discard(head)
+                delta['food_removed'].append(head)
+                snake.grow += 1
+                snake.score += 1
+                delta['scores'].append((player, snake.score))
+
+        for player in list(self.waiting):
+            if self.waiting[player] > 0:
+                self.waiting[player] -= 1
+                continue
+            snake = self.spawn()
+            if snake is None:
+                continue
+            for cell in snake.body:
+                self.occupy(cell)
+            self.players[player] = snake
+            del self.waiting[player]
+            delta['spawns'].append((player, list(snake.body)))
+
+        delta['food_added'] = self.place_food()
+        return delta
+
+    def welcome(self, player, tick_rate=TICK_RATE):
+        return {
+            'player': player,
+            'columns': self.columns,
+            'rows': self.rows,
+            'walls': self.walls,
+            'obstacles': self.obstacles,
+            'tick_rate': tick_rate,
+        }
+
+    def snapshot(self):
+        return {
+            'tick': self.tick,
+            'snakes': {player: list(snake.body) for player, snake in self.players.items()},
+            'scores': {player: snake.score for player, snake in self.players.items()},
+            'food': sorted(self.food),
+        }
+
+
+class SnakeServer:
+
+    def __init__(self, world, host=HOST, port=PORT, tick_rate=TICK_RATE, window=WINDOW):
+        self.world = world
+        self.host = host
+        self.port = port
+        self.tick_rate = tick_rate
+        self.clients = {}
+        self.pending = {}
+        self.server = None
+        self.handlers = set()
+        self.tick_times = RollingHistogram(window)
+        self.history = deque(maxlen=window)
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, backlog=BACKLOG)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        # Closing the connections ends every handler on its own, so none is
+        # left to be cancelled mid-read.
+        if self.server is not None:
+            self.server.close()
+        for writer in list(self.clients.values()) + list(self.pending.values()):
+            writer.close()
+        if self.handlers:
+            await asyncio.wait(self.handlers)
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self.handlers.add(task)
+        player = self.world.join()
+        if player is None:
+            writer.close()
+            self.handlers.discard(task)
+            return
+        writer.write(frame(encode_json(WELCOME, self.world.welcome(player, self.tick_rate))))
+        # The snapshot goes out at the end of a tick, so it lines up with the
+        # deltas that follow it.
+        self.pending[player] = writer
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload[0] == TURN and len(payload) > 1:
+                    self.world.turn(player, payload[1])
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.drop(player)
+            self.handlers.discard(task)
+
+    def drop(self, player):
+        # Called again by the handler after a broadcast dropped the player;
+        # by then the id may already belong to someone else.
+        writer = self.clients.pop(player, None) or self.pending.pop(player, None)
+        if writer is None:
+            return
+        self.world.leave(player)
+        writer.close()
+
+    def broadcast(self):
+        start = time.perf_counter()
+        delta = self.world.step()
+        message = frame(encode_delta(delta))
+        for player, writer in list(self.clients.items()):
+            # A client that stops reading is dropped rather than buffered
+            # without bound.
+            if writer.is_closing() or writer.transport.get_write_buffer_size() > MAX_BUFFER:
+                self.drop(player)
+            else:
+                writer.write(message)
+        snapshot = 0
+        if self.pending:
+            payload = frame(encode_json(SNAPSHOT, self.world.snapshot()))
+            snapshot = len(payload)
+            for player, writer in self.pending.items():
+                writer.write(payload)
+                self.clients[player] = writer
+            self.pending.clear()
+        elapsed = time.perf_counter() - start
+        self.tick_times.add(elapsed)
+        self.history.append({
+            'tick': delta['tick'],
+            'seconds': elapsed,
+            'clients': len(self.clients),
+            'snakes': len(self.world.players),
+            'delta_bytes': len(message),
+            'sent_bytes': len(message) * len(self.clients),
+            'snapshot_bytes': snapshot,
+        })
+        return delta
+
+    async def run(self, ticks=None):
+        # Fixed tick on the loop clock: a slow tick eats into the next sleep
+        # instead of shifting every later tick.
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / self.tick_rate
+        deadline = loop.time()
+        count = 0
+        while ticks is None or count < ticks:
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+            # One failing tick is reported, not allowed to stop the server
+            # for every client.
+            try:
+                self.broadcast()
+            except Exception as error:
+                print('tick {0} failed: {1!r}'.format(self.world.tick, error), file=sys.stderr)
+            count += 1
+
+
+class Bot:
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.state = None
+        self.received = 0
+        self.writer = None
+
+    async def play(self, host, port):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        try:
+            while True:
+                payload = await read_frame(reader)
+                self.received += len(payload)
+                kind = payload[0]
+                if kind == WELCOME:
+                    self.state = ClientState(decode_json(payload))
+                elif kind == SNAPSHOT:
+                    self.state.apply_snapshot(decode_json(payload))
+                elif kind == DELTA:
+                    self.state.apply_delta(decode_delta(payload))
+                    if self.rng.random() < BOT_TURN_CHANCE:
+                        self.writer.write(frame(encode_turn(self.rng.choice(list(DIRECTIONS)))))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] if ordered else 0
+
+
+async def load_test(clients=LOAD_CLIENTS, ticks=LOAD_TICKS, tick_rate=TICK_RATE, seed=0, **world_options):
+    world = World(seed=seed, **world_options)
+    server = await SnakeServer(world, port=0, tick_rate=tick_rate).start()
+    bots = [Bot(seed + i) for i in range(clients)]
+    tasks = [asyncio.ensure_future(bot.play(server.host, server.port)) for bot in bots]
+    while len(server.pending) + len(server.clients) < clients:
+        failed = [task for task in tasks if task.done()]
+        if failed:
+            await server.close()
+            raise failed[0].exception() or RuntimeError('a load test client disconnected early')
+        await asyncio.sleep(0.01)
+    await server.run(ticks)
+
+    # Let the bots drain their sockets, then check every mirror against the
+    # authoritative state.
+    for _ in range(200):
+        if all(bot.state is not None and bot.state.tick == world.tick for bot in bots):
+            break
+        await asyncio.sleep(0.01)
+    snapshot = world.snapshot()
+    bodies = {player: [tuple(cell) for cell in body] for player, body in snapshot['snakes'].items()}
+    mismatches = sum(1 for bot in bots if bot.state is None or bot.state.tick != world.tick or
+                     {player: list(body) for player, body in bot.state.snakes.items()} != bodies or
+                     bot.state.food != world.food)
+
+    for bot in bots:
+        bot.close()
+    await server.close()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    history = list(server.history)
+    seconds = [entry['seconds'] for entry in history]
+    delta_bytes = [entry['delta_bytes'] for entry in history]
+    full_bytes = len(frame(encode_json(SNAPSHOT, snapshot)))
+    return {
+        'clients': clients,
+        'ticks': len(history),
+        'tick_rate': tick_rate,
+        'snakes': len(world.players),
+        'tick_ms': {'p50': percentile(seconds, 50) * 1000, 'p95': percentile(seconds, 95) * 1000,
+                    'p99': percentile(seconds, 99) * 1000, 'max': max(seconds) * 1000},
+        'delta_bytes_per_tick': {'mean': sum(delta_bytes) / len(delta_bytes), 'max': max(delta_bytes)},
+        'sent_bytes_per_tick': sum(entry['sent_bytes'] for entry in history) / len(history),
+        'full_state_bytes': full_bytes,
+        'mismatched_clients': mismatches,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run an authoritative multiplayer snake server.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--columns', type=int, default=COLUMNS)
+    parser.add_argument('--rows', type=int, default=ROWS)
+    parser.add_argument('--food', type=int, default=FOOD)
+    parser.add_argument('--tick-rate', type=int, default=TICK_RATE)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--load', type=int, default=None, metavar='CLIENTS',
+                        help='run a localhost load test with this many bots and print stats as JSON')
+    parser.add_argument('--ticks', type=int, default=LOAD_TICKS, help='load test length')
+    args = parser.parse_args(argv)
+
+    if args.load:
+        report = asyncio.run(load_test(args.load, args.ticks, args.tick_rate, args.seed or 0, columns=args.columns,
+                                       rows=args.rows, food=args.food))
+        json.dump(report, sys.stdout, indent=2)
+        return 1 if report['mismatched_clients'] else 0
+
+    async def serve():
+        world = World(args.columns, args.rows, food=args.food, seed=args.seed)
+        server = await SnakeServer(world, args.host, args.port, args.tick_rate).start()
+        print('serving on {0}:{1}'.format(server.host, server.port), file=sys.stderr)
+        await server.run()
+
+    asyncio.run(serve())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import numpy as np
+from engine import ATE, COLUMNS, DIED, DOWN, LEFT, MISTAKE, NOOP, OBSTACLES, RIGHT, ROWS, START_LENGTH, UP
+
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+SPAWN_TRIES = 8
+
+# dx, dy per action; NOOP keeps the current direction.
+ACTION_DX = np.array([0, 0, 0, -1, 1], dtype=np.int64)
+ACTION_DY = np.array([0, -1, 1, 0, 0], dtype=np.int64)
+
+
+def splitmix64(state):
+    with np.errstate(over='ignore'):
+        z = state
+        z = (z ^ (z >> np.uint64(30))) * MIX_1
+        z = (z ^ (z >> np.uint64(27))) * MIX_2
+        return z ^ (z >> np.uint64(31))
+
+
+class VectorSnakeEnv:
+
+    def __init__(self, games, columns=COLUMNS, rows=ROWS, walls=True, obstacles=OBSTACLES,
+                 start_length=START_LENGTH, seed=0):
+        self.games = games
+        self.columns = columns
+        self.rows = rows
+        self.walls = walls
+        self.obstacle_count = obstacles
+        self.start_length = start_length
+        self.cells = columns * rows
+        self.capacity = self.cells
+
+        index_dtype = np.int16 if self.cells < (1 << 15) else np.int32
+        self.body = np.zeros((games, self.capacity), dtype=index_dtype)
+        self.head_pos = np.zeros(games, dtype=np.int64)
+        self.length = np.zeros(games, dtype=np.int64)
+        self.head = np.zeros(games, dtype=np.int64)
+        self.dx = np.zeros(games, dtype=np.int64)
+        self.dy = np.zeros(games, dtype=np.int64)
+        self.food = np.zeros(games, dtype=np.int64)
+        self.mistake = np.zeros(games, dtype=np.int64)
+        self.obstacles = np.zeros((games, obstacles), dtype=np.int64)
+        self.static = np.zeros((games, self.cells), dtype=np.uint8)
+        self.occupied = np.zeros((games, self.cells), dtype=np.uint8)
+        self.score = np.zeros(games, dtype=np.int64)
+        self.ticks = np.zeros(games, dtype=np.int64)
+        self.alive = np.zeros(games, dtype=bool)
+        self.episode_score = np.zeros(games, dtype=np.int64)
+        self.episodes = np.zeros(games, dtype=np.int64)
+        self.rng_state = np.zeros(games, dtype=np.uint64)
+        self._games = np.arange(games)
+
+        self.wall_template = np.zeros(self.cells, dtype=np.uint8)
+        if walls:
+            border = self.wall_template.reshape(rows, columns)
+            border[0, :] = border[-1, :] = border[:, 0] = border[:, -1] = 1
+
+        # Walls never move, so spawns draw from the other cells only.
+        self.open_cells = np.flatnonzero(self.wall_template == 0)
+
+        start = [(1 - i) % columns + columns for i in range(start_length)]
+        self.start_cells = np.array(start, dtype=np.int64)
+        self.start_front = columns + 2
+
+        self.seed(seed)
+        self.reset()
+
+    def seed(self, seed=0):
+        # One SplitMix64 stream per game: game i replays the same way whatever
+        # the batch size, and a list of seeds pins each game individually.
+        if np.isscalar(seed):
+            seeds = np.uint64(seed) + np.arange(self.games, dtype=np.uint64) * GOLDEN
+        else:
+            seeds = np.asarray(seed, dtype=np.uint64)
+        self.rng_state[:] = splitmix64(seeds)
+
+    def _random(self, games, size=None):
+        count = 1 if size is None else size
+        with np.errstate(over='ignore'):
+            steps = np.arange(1, count + 1, dtype=np.uint64) * GOLDEN
+            values = splitmix64(self.rng_state[games][:, None] + steps)
+            self.rng_state[games] += np.uint64(count) * GOLDEN
+        return values[:, 0] if size is None else values
+
+    def _draw(self, games, size=None):
+        return self.open_cells[(self._random(games, size) % np.uint64(len(self.open_cells))).astype(np.int64)]
+
+    def _spawn(self, games, *items):
+        # Draw a cell off the walls and redraw the lanes that hit an obstacle,
+        # the body or one of `items`, so spawns are uniform over the free
+        # cells as in the engine. Lanes still unlucky after SPAWN_TRIES (a
+        # crowded board) pick exactly among their free cells; -1 means full.
+        cells = np.full(len(games), -1, dtype=np.int64)
+        pending = np.arange(len(games))
+        for _ in range(SPAWN_TRIES):
+            if len(pending) == 0:
+                return cells
+            lanes = games[pending]
+            candidate = self._draw(lanes)
+            free = (self.static[lanes, candidate] | self.occupied[lanes, candidate]) == 0
+            for item in items:
+                free &= candidate != item[pending]
+            cells[pending[free]] = candidate[free]
+            pending = pending[~free]
+        if len(pending):
+            lanes = games[pending]
+            free = (self.static[lanes] | self.occupied[lanes]) == 0
+            for item in items:
+                taken = item[pending] >= 0
+                free[np.flatnonzero(taken), item[pending][taken]] = False
+            counts = free.sum(axis=1)
+            picks = (self._random(lanes) % np.maximum(counts, 1).astype(np.uint64)).astype(np.int64)
+            picked = (np.cumsum(free, axis=1) > picks[:, None]).argmax(axis=1)
+            cells[pending] = np.where(counts > 0, picked, -1)
+        return cells
+
+    def _scatter(self, games):
+        # All obstacles of a fresh board in one draw. Entries on the start
+        # snake, the cell in front of it or an earlier obstacle are redrawn;
+        # boards still clashing are filled one obstacle at a time.
+        count = self.obstacle_count
+        blocked = self.wall_template.copy()
+        blocked[self.start_cells] = 1
+        blocked[self.start_front] = 1
+        cells = self._draw(games, count)
+        earlier = np.tri(count, k=-1, dtype=bool)
+        for attempt in range(SPAWN_TRIES + 1):
+            bad = (blocked[cells] != 0) | ((cells[:, :, None] == cells[:, None, :]) & earlier).any(axis=2)
+            rows = np.flatnonzero(bad.any(axis=1))
+            if len(rows) == 0 or attempt == SPAWN_TRIES:
+                break
+            fresh = self._draw(games[rows], count)
+            cells[rows] = np.where(bad[rows], fresh, cells[rows])
+        if len(rows):
+            lanes = games[rows]
+            front = np.full(len(rows), self.start_front)
+            for k in range(count):
+                cells[rows, k] = self._spawn(lanes, front)
+                placed = cells[rows, k] >= 0
+                self.static[lanes[placed], cells[rows, k][placed]] = 1
+        return cells
+
+    def reset(self, games=None):
+        if games is None:
+            games = self._games
+        games = np.asarray(games)
+        if len(games) == 0:
+            return
+
+        self.static[games] = self.wall_template
+        self.occupied[games] = 0
+        self.occupied[games[:, None], self.start_cells] = 1
+
+        # Obstacles, then food, then the mistake, each on a free cell. The
+        # cell in front of the starting head stays clear so that no round is
+        # lost on its first tick.
+        if self.obstacle_count:
+            obstacles = self._scatter(games)
+            self.obstacles[games] = obstacles
+            placed = obstacles >= 0
+            self.static[np.broadcast_to(games[:, None], obstacles.shape)[placed], obstacles[placed]] = 1
+        self.food[games] = self._spawn(games)
+        self.mistake[games] = self._spawn(games, self.food[games])
+
+        length = self.start_length
+        self.body[games, :length] = self.start_cells[::-1]
+        self.head_pos[games] = length - 1
+        self.length[games] = length
+        self.head[games] = self.start_cells[0]
+        self.dx[games] = 1
+        self.dy[games] = 0
+        self.score[games] = 0
+        self.ticks[games] = 0
+        self.alive[games] = True
+
+    def step(self, actions=None):
+        games = self._games
+        if actions is None:
+            actions = np.full(self.games, NOOP)
+        actions = np.asarray(actions)
+
+        vertical = self.dx == 0
+        turn = (((actions == LEFT) | (actions == RIGHT)) & vertical) | \
+               (((actions == UP) | (actions == DOWN)) & ~vertical)
+        self.dx = np.where(turn, ACTION_DX[actions], self.dx)
+        self.dy = np.where(turn, ACTION_DY[actions], self.dy)
+
+        tail_pos = (self.head_pos - self.length + 1) % self.capacity
+        tail = self.body[games, tail_pos].astype(np.int64)
+        self.occupied[games, tail] -= 1
+
+        x = (self.head % self.columns + self.dx) % self.columns
+        y = (self.head // self.columns + self.dy) % self.rows
+        head = y * self.columns + x
+        died = (self.static[games, head] | self.occupied[games, head]) != 0
+
+        self.head_pos = (self.head_pos + 1) % self.capacity
+        self.body[games, self.head_pos] = head
+        self.occupied[games, head] += 1
+        self.head = head
+        self.ticks += 1
+
+        ate = (head == self.food) & ~died
+        self.length += ate
+        self.occupied[games[ate], tail[ate]] += 1
+        self.score += ate
+        if ate.any():
+            eaters = games[ate]
+            self.food[ate] = self._spawn(eaters, self.mistake[ate])
+
+        events = np.zeros(self.games, dtype=np.uint8)
+        events[ate] |= ATE
+        events[(head == self.mistake) & ~died] |= MISTAKE
+        events[died] |= DIED
+
+        if died.any():
+            finished = games[died]
+            self.episode_score[finished] = self.score[finished]
+            self.episodes[finished] += 1
+            self.reset(finished)
+        return events
+
+    def heads(self):
+        return np.stack([self.head % self.columns, self.head // self.columns], axis=1)